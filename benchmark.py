@@ -0,0 +1,240 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from math import ceil
+from struct import pack, unpack
+
+from scale_plots.sdf import SdfFile, iter_sdf, _decode_fixed, _line_starts
+from scale_plots.coverx import read_coverx, _read_header, _record
+from scale_plots.groups import GroupStructure, step_values
+
+
+def write_sdf(filename, num_groups=252, num_profiles=2000, type_b=True, seed=0):
+    '''Write a synthetic sdf file with random sensitivities.'''
+    rng = np.random.default_rng(seed)
+    bounds = np.logspace(np.log10(2e7), -5, num_groups+1)
+    nuclides = [('u-235', 92235), ('u-238', 92238), ('h-1', 1001), ('o-16', 8016), ('zr-90', 40090)]
+    reactions = [('total', 1), ('elastic', 2), ("n,n'", 4), ('fission', 18), ('n,gamma', 102), ('nubar', 452)]
+
+    def block(values):
+        # Five values per line like the scale output
+        return ''.join(''.join('{:14.6E}'.format(v) for v in values[i:i+5]) + '\n'
+                       for i in range(0, len(values), 5))
+
+    with open(filename, 'w') as file:
+        file.write('synthetic sdf file\n')
+        file.write('{:>6} number of neutron groups\n'.format(num_groups))
+        file.write('{:>6} number of sensitivity profiles\n'.format(num_profiles))
+        file.write('  1.000000E+00 +/-  1.000000E-04\n')
+        file.write('energy boundaries:\n')
+        file.write(block(bounds))
+        for i in range(num_profiles):
+            nuclide, za = nuclides[i % len(nuclides)]
+            reaction, mt = reactions[(i // len(nuclides)) % len(reactions)]
+            region = i // (len(nuclides) * len(reactions))
+            sens = rng.normal(0, 1e-3, num_groups)
+            if type_b:
+                file.write('{:<16} {:<16} {:>8} {:>5}\n'.format(nuclide, reaction, za, mt))
+                file.write('{:>6} {:>6}\n'.format(0, region))
+                file.write('  {:14.6E} {:14.6E} {:14.6E} {:14.6E}\n'.format(sens.sum(), 1e-4, 0, 0))
+                file.write('  {:14.6E} {:14.6E}\n'.format(0, 0))
+                file.write(block(sens))
+                file.write(block(np.abs(sens) * 0.1))
+            else:
+                file.write('{:<16} {:<16} {:>8} {:>5} {:>5} {:>5}\n'.format(nuclide, reaction, za, mt, region, 0))
+                file.write('  {:14.6E} {:14.6E}\n'.format(sens.sum(), 0))
+                file.write(block(sens))
+
+
+def write_coverx(filename, num_groups=56, num_mat_mt=60, seed=0):
+    '''Write a synthetic big-endian COVERX library with 
+    random banded matrices for every pair of reactions 
+    of the same material.'''
+    rng = np.random.default_rng(seed)
+
+    def record(payload):
+        # Fortran records are wrapped in their length in bytes
+        return pack('>i', len(payload)) + payload + pack('>i', len(payload))
+
+    mat_mts = [(1000 + i // 6, [1, 2, 4, 18, 102, 452][i % 6]) for i in range(num_mat_mt)]
+    pairs = [a + b for i, a in enumerate(mat_mts) for b in mat_mts[i:] if a[0] == b[0]]
+    records = [record(b'synthetic covariance library'),
+               record(pack('>7i', num_groups, num_groups, 0, 2, len(mat_mts), len(pairs), 0)),
+               record(b'synthetic'),
+               record(np.logspace(np.log10(2e7), -5, num_groups+1).astype('>f4').tobytes()),
+               record(np.array([(mat, mt, 1) for mat, mt in mat_mts], dtype='>i4').tobytes())]
+    for _ in mat_mts:
+        records.append(record(rng.random(2*num_groups).astype('>f4').tobytes()))
+    for pair in pairs:
+        records.append(record(pack('>5i', *pair, 1)))
+        # Band of every column around the diagonal
+        below = rng.integers(0, num_groups, num_groups)
+        first = np.maximum(np.arange(num_groups) - below, 0)
+        last = np.minimum(np.arange(num_groups) + rng.integers(0, num_groups, num_groups), num_groups-1)
+        num_vals = last - first + 1
+        diag_pos = np.arange(num_groups) - first + 1
+        control = np.column_stack([num_vals, diag_pos]).ravel()
+        records.append(record(np.append(control, num_groups).astype('>i4').tobytes()))
+        records.append(record(rng.normal(0, 1e-3, num_vals.sum()).astype('>f4').tobytes()))
+    with open(filename, 'wb') as file:
+        file.write(b''.join(records))
+
+
+def best_time(func, repeat):
+    # Smallest wall time out of several runs
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_sdf_decoding(filename, repeat):
+    # Original approach of splitting the joined lines of every profile
+    def split_lines():
+        with SdfFile(filename) as sdf:
+            start = 5 + ceil((sdf.num_neutron_groups+1) / 5)
+            lines_values = sdf.lines_values
+            lines_profile = sdf.lines_profile
+            num_profiles = sdf.num_sens_profiles
+        with open(filename, 'r') as file:
+            lines = file.readlines()
+        for i in range(num_profiles):
+            sens_start = start + i*lines_profile + 4
+            np.array(''.join(lines[sens_start : sens_start+lines_values]).split(), dtype=float)
+            np.array(''.join(lines[sens_start+lines_values : sens_start+2*lines_values]).split(), dtype=float)
+
+    # Per profile decoding through the streaming generator
+    def per_profile():
+        for _ in iter_sdf(filename):
+            pass
+
+    # One numpy call for all of the value blocks
+    def bulk():
+        with SdfFile(filename) as sdf:
+            sdf.read_profiles()
+
+    # The joined value blocks that the bulk decoding parses
+    with SdfFile(filename) as sdf:
+        line_starts = _line_starts(sdf._mm, sdf.profiles_start)
+        first_lines = np.arange(sdf.num_sens_profiles) * sdf.lines_profile + (2 if sdf.type_a else 4)
+        text = b''.join([sdf._mm[start:end] for start, end in
+                         zip(line_starts[first_lines], line_starts[first_lines + sdf.lines_values])])
+
+    t_split = best_time(split_lines, repeat)
+    t_profile = best_time(per_profile, repeat)
+    t_bulk = best_time(bulk, repeat)
+    t_text = best_time(lambda: np.fromstring(text, sep=' '), repeat)
+    t_fixed = best_time(lambda: _decode_fixed(text), repeat)
+    print('sdf decoding ({:.1f} MB)'.format(os.path.getsize(filename) / 1e6))
+    print('  readlines and split : {:8.3f} s'.format(t_split))
+    print('  streaming profiles  : {:8.3f} s'.format(t_profile))
+    print('  bulk decoding       : {:8.3f} s ({:.1f}x faster than split)'.format(t_bulk, t_split / t_bulk))
+    print('  value blocks only')
+    print('    text parse        : {:8.3f} s'.format(t_text))
+    print('    fixed width       : {:8.3f} s ({:.1f}x faster than text parse)'.format(t_fixed, t_text / t_fixed))
+
+
+def bench_coverx_decoding(filename, repeat):
+    # Original approach of unpacking and placing one element at a time
+    def per_element():
+        with open(filename, 'rb') as file:
+            full_file = file.read()
+        header = _read_header(full_file)
+        num_groups = header['num_energy_group']
+        offset = header['matrices_start']
+        for _ in range(header['num_matrix']):
+            offset = _record(full_file, offset, header['int'])[2]
+            start, _, offset = _record(full_file, offset, header['int'])
+            block_cntrl = [unpack('>ii', full_file[start+8*j:start+8*j+8]) for j in range(num_groups)]
+            start, _, offset = _record(full_file, offset, header['int'])
+            matrix = np.zeros((num_groups, num_groups))
+            for col, (num_vals, diag_pos) in enumerate(block_cntrl):
+                full_col = unpack('>' + 'f'*num_vals, full_file[start:start+num_vals*4])
+                for row in range(num_vals):
+                    matrix[col+row-diag_pos+1][col] = full_col[row]
+                start += num_vals*4
+
+    t_element = best_time(per_element, repeat)
+    t_vector = best_time(lambda: read_coverx(filename), repeat)
+    print('COVERX decoding ({:.1f} MB)'.format(os.path.getsize(filename) / 1e6))
+    print('  per element         : {:8.3f} s'.format(t_element))
+    print('  vectorized          : {:8.3f} s ({:.1f}x faster than per element)'.format(t_vector, t_element / t_vector))
+
+
+def bench_plot_prep(repeat, curves=20):
+    # Original approach of growing the step arrays one group at a time
+    def append_steps(sens, stdevs):
+        sens_step = np.array([], dtype=float)
+        stdev_step = np.array([], dtype=float)
+        for j in range(len(sens)):
+            sens_step = np.append(sens_step, [sens[j], sens[j]])
+            stdev_step = np.append(stdev_step, [stdevs[j], stdevs[j]])
+        return sens_step, stdev_step
+
+    # Step arrays built with np.repeat
+    def repeat_steps(groups, sens, stdevs):
+        window = groups.window()
+        return groups.step_bounds(window), step_values(sens[window]), step_values(stdevs[window])
+
+    print('step plot preparation per curve ({} curves)'.format(curves))
+    print('  {:>6} {:>14} {:>14} {:>16}'.format('groups', 'np.append', 'np.repeat', 'repeat per group'))
+    rng = np.random.default_rng(0)
+    for num_groups in (44, 252, 1000, 4000):
+        groups = GroupStructure(np.logspace(np.log10(2e7), -5, num_groups+1))
+        sens = rng.normal(0, 1e-3, (curves, num_groups))
+        stdevs = np.abs(sens) * 0.1
+        t_append = best_time(lambda: [append_steps(sens[i], stdevs[i]) for i in range(curves)], repeat) / curves
+        t_repeat = best_time(lambda: [repeat_steps(groups, sens[i], stdevs[i]) for i in range(curves)], repeat) / curves
+        print('  {:>6} {:>12.1f}us {:>12.1f}us {:>14.4f}us'.format(num_groups, t_append*1e6, t_repeat*1e6,
+                                                                   t_repeat*1e6 / num_groups))
+
+
+def bench_import_time(repeat):
+    # Time a fresh interpreter importing the package with -X importtime
+    def import_times():
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import scale_plots'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+        # Lines are 'import time: self [us] | cumulative | imported package'
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                parts = line[len('import time:'):].split('|')
+                if parts[0].strip().isdigit():
+                    times[parts[2].strip()] = int(parts[1])
+        return times
+
+    runs = [import_times() for _ in range(repeat)]
+    times = min(runs, key=lambda run: run['scale_plots'])
+    print('import scale_plots')
+    print('  cumulative          : {:8.3f} s'.format(times['scale_plots'] / 1e6))
+    # Heavy dependencies should only load on first plot or DataFrame
+    heavy = [name for name in ('pandas', 'matplotlib', 'matplotlib.pyplot', 'scipy') if name in times]
+    print('  heavy imports       : {}'.format(', '.join(heavy) if heavy else 'none'))
+    top = sorted((name for name in times if '.' not in name and name != 'scale_plots'), key=times.get, reverse=True)[:5]
+    for name in top:
+        print('  {:<20}: {:8.3f} s'.format(name, times[name] / 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for scale_plots.')
+    parser.add_argument('--groups', type=int, default=252, help='energy groups in the synthetic files')
+    parser.add_argument('--profiles', type=int, default=5000, help='profiles in the synthetic sdf file')
+    parser.add_argument('--reactions', type=int, default=60, help='material reactions in the synthetic covariance file')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per timing')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sdf_file = os.path.join(tmp, 'synthetic.sdf')
+        write_sdf(sdf_file, args.groups, args.profiles)
+        bench_sdf_decoding(sdf_file, args.repeat)
+        cov_file = os.path.join(tmp, 'scale.synthetic.groupcov')
+        write_coverx(cov_file, args.groups, args.reactions)
+        bench_coverx_decoding(cov_file, args.repeat)
+    bench_plot_prep(args.repeat)
+    bench_import_time(args.repeat)
@@ -1,3 +1,3 @@
-from scale_plots.plots import *
+from scale_plots.plots import Plots
 from scale_plots.scale_ids import *
-from scale_plots.test import *
+from scale_plots.test import Test
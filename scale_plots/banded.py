@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class BandedMatrix():
+    '''Square matrix that only stores the band of
+    values in each column, the same layout the COVERX
+    files use. Column j holds the values of rows
+    first[j] to first[j]+num_vals[j]-1 and every other
+    element is zero. Slicing returns dense numpy arrays
+    while scaling and products work on the band.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        The band of every column one after the other.
+    indptr : numpy.ndarray
+        num_groups+1 positions in values where each
+        column starts followed by the number of values.
+    first : numpy.ndarray
+        Row of the first value stored in each column.
+
+    '''
+
+    # Make numpy operators like array @ matrix defer to
+    # the methods below instead of expanding the matrix
+    __array_ufunc__ = None
+
+    def __init__(self, values, indptr, first):
+        self.values = values
+        self.indptr = np.asarray(indptr, dtype=np.intp)
+        self.first = np.asarray(first, dtype=np.intp)
+        self.shape = (len(self.first), len(self.first))
+        self.ndim = 2
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.indptr.nbytes + self.first.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        matrix = self.toarray()
+        return matrix if dtype is None else matrix.astype(dtype)
+
+    def __getitem__(self, key):
+        # Only the selected columns are expanded
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, cols = key
+        col_index = np.arange(self.shape[1])[cols]
+        block = self._dense_columns(np.atleast_1d(col_index))
+        if np.ndim(col_index) == 0:
+            block = block[:, 0]
+        return block[rows]
+
+    def toarray(self):
+        '''Return the matrix as a dense numpy array.'''
+        return self._dense_columns(np.arange(self.shape[1]))
+
+    def scale(self, row_factors, col_factors=None):
+        '''Return the matrix with each element [i, j]
+        multiplied by row_factors[i] * col_factors[j].
+        col_factors defaults to row_factors.'''
+        if col_factors is None:
+            col_factors = row_factors
+        rows, cols = _coords(self.indptr, self.first)
+        values = self.values * np.asarray(row_factors)[rows] * np.asarray(col_factors)[cols]
+        return BandedMatrix(values, self.indptr, self.first)
+
+    def __matmul__(self, other):
+        # Matrix times a vector or a (num_groups, n) array
+        other = np.asarray(other)
+        rows, cols = _coords(self.indptr, self.first)
+        product = np.zeros((self.shape[0],) + other.shape[1:], dtype=np.result_type(self.values, other))
+        terms = other[cols] * self.values.reshape((-1,) + (1,)*(other.ndim-1))
+        np.add.at(product, rows, terms)
+        return product
+
+    def __rmatmul__(self, other):
+        # A vector or (n, num_groups) array times the matrix
+        other = np.asarray(other)
+        rows, cols = _coords(self.indptr, self.first)
+        product = np.zeros((self.shape[1],) + other.shape[:-1], dtype=np.result_type(self.values, other))
+        terms = other.T[rows] * self.values.reshape((-1,) + (1,)*(other.ndim-1))
+        np.add.at(product, cols, terms)
+        return product.T
+
+    def sandwich(self, left, right=None):
+        '''Return left @ matrix @ right.T for each row
+        of left and right, the sandwich rule for the
+        variance from a sensitivity and covariance.
+
+        Parameters
+        ----------
+        left : numpy.ndarray
+            A num_groups vector or (n, num_groups) array.
+        right : numpy.ndarray, optional
+            Same shape as left. Defaults to left.
+
+        Returns
+        -------
+        product : float or numpy.ndarray
+            One value for every row of left.
+
+        '''
+        left = np.asarray(left)
+        right = left if right is None else np.asarray(right)
+        rows, cols = _coords(self.indptr, self.first)
+        return (left[..., rows] * right[..., cols]) @ self.values
+
+    def _dense_columns(self, col_index):
+        # Dense (num_groups, len(col_index)) array of the selected columns
+        counts = self.indptr[col_index+1] - self.indptr[col_index]
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.repeat(self.first[col_index], counts) + within
+        cols = np.repeat(np.arange(len(col_index)), counts)
+        block = np.zeros((self.shape[0], len(col_index)), dtype=float)
+        block[rows, cols] = self.values[np.repeat(self.indptr[col_index], counts) + within]
+        return block
+
+
+def _coords(indptr, first):
+    # Row and column of every stored value
+    counts = np.diff(indptr)
+    cols = np.repeat(np.arange(len(first)), counts)
+    rows = np.arange(indptr[-1]) - np.repeat(indptr[:-1] - first, counts)
+    return rows, cols
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+# Plot kinds and the Plots method that draws them
+PLOT_KINDS = {'sensitivity': 'sensitivity_plot',
+              'sensitivity_lethargy': 'sensitivity_lethargy_plot',
+              'heatmap': 'heatmap_plot'}
+
+# Each process keeps its Plots so files are only parsed once
+_plots = None
+_loaded = set()
+
+
+def render_plots(specs, workers=None, cache_dir=None):
+    '''Render plots to files without showing them. Each
+    plot is saved in the format of its output extension,
+    e.g. '.png', '.pdf' or '.svg'. Worker processes draw
+    with the Agg backend.
+
+    Parameters
+    ----------
+    specs : list of dict
+        One dictionary per plot with
+        'kind' one of 'sensitivity', 'sensitivity_lethargy'
+        or 'heatmap',
+        'output' the file to save the plot to,
+        'sdf' list of sdf files for sensitivity plots,
+        'keys' the keys to plot for sensitivity plots,
+        'coverx' the covariance file for heatmaps,
+        'mat_mt_1' and 'mat_mt_2' the pairs for heatmaps and
+        'options' optional dictionary of other arguments
+        to the plot function.
+    workers : int, optional
+        Number of processes to render with. Defaults
+        to the number of CPUs. If 1 the plots are
+        rendered in this process.
+    cache_dir : str, optional
+        Cache directory for the parsed files. See
+        scale_plots.Plots.
+
+    Returns
+    -------
+    results : list of dict
+        One dictionary per spec in the same order with
+        'output' the saved file, 'seconds' the time to
+        load and render it and 'error' a description of
+        the error or None.
+
+    '''
+    specs = list(specs)
+    if workers == 1:
+        # Leave the backend of this process alone
+        _init_worker(cache_dir, backend=None)
+        return [_render(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+        return list(pool.map(_render, specs))
+
+
+def _init_worker(cache_dir, backend='Agg'):
+    # Draw to files only and start with nothing loaded
+    global _plots
+    if backend is not None:
+        matplotlib.use(backend)
+    from .plots import Plots
+    _plots = Plots(cache_dir=cache_dir)
+    _loaded.clear()
+
+
+def _render(spec):
+    # Load the files of a spec and save its plot
+    import matplotlib.pyplot as plt
+    output = spec.get('output')
+    start = time.perf_counter()
+    try:
+        kind = spec['kind']
+        assert kind in PLOT_KINDS, "Plot kind must be one of {}.".format(', '.join(PLOT_KINDS))
+        assert output is not None, "Each plot needs an 'output' file."
+        options = dict(spec.get('options', {}))
+        if kind == 'heatmap':
+            coverx = spec['coverx']
+            if coverx not in _loaded:
+                _plots.parse_coverx(coverx)
+                _loaded.add(coverx)
+            args = (tuple(spec['mat_mt_1']), tuple(spec['mat_mt_2']), os.path.basename(coverx))
+        else:
+            to_load = [filename for filename in spec.get('sdf', []) if filename not in _loaded]
+            if to_load:
+                errors = _plots.load_sdfs(to_load, workers=1)
+                assert not errors, '; '.join(errors.values())
+                _loaded.update(to_load)
+            args = ([list(key) for key in spec['keys']],)
+        fig = getattr(_plots, PLOT_KINDS[kind])(*args, save_as=output, show=False, **options)
+        plt.close(fig)
+        error = None
+    except Exception as err:
+        plt.close('all')
+        error = '{}: {}'.format(type(err).__name__, err)
+    return {'output': output, 'seconds': time.perf_counter() - start, 'error': error}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a JSON list of plot specs to files.')
+    parser.add_argument('specs', help='JSON file with a list of plot specs. See render_plots.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes. Defaults to the number of CPUs.')
+    parser.add_argument('--cache-dir', default=None, help='Cache directory for the parsed files.')
+    args = parser.parse_args(argv)
+
+    with open(args.specs) as file:
+        specs = json.load(file)
+    start = time.perf_counter()
+    results = render_plots(specs, args.workers, args.cache_dir)
+    for result in results:
+        if result['error'] is None:
+            print('{:>8.3f} s  {}'.format(result['seconds'], result['output']))
+        else:
+            print('{:>8.3f} s  {} failed. {}'.format(result['seconds'], result['output'], result['error']))
+    failed = sum(result['error'] is not None for result in results)
+    print('Rendered {} of {} plots in {:.3f} s'.format(len(results) - failed, len(results), time.perf_counter() - start))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
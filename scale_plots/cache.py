@@ -0,0 +1,231 @@
+import hashlib
+import io
+import os
+import threading
+import numpy as np
+
+from .banded import BandedMatrix
+from .coverx import read_coverx
+from .groups import GroupStructure
+from .sdf import read_sdf, _selected
+
+# Change whenever the layout of the cached arrays changes
+CACHE_VERSION = 2
+
+
+class DiskCache():
+    '''On-disk cache of parsed sdf and COVERX files.
+    Each parsed file is saved as a .npz file in the
+    cache directory. Entries are keyed by the path, size,
+    modification time and a hash of the contents of the
+    source file, so a changed file is parsed again. The
+    least recently used entries are removed once the
+    cache grows past max_bytes.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to save the cached files in.
+    max_bytes : int, optional
+        Size limit of the cache directory.
+        Defaults to 2 GB.
+
+    '''
+
+    def __init__(self, directory, max_bytes=2*1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filename, kind):
+        '''Return the cache key for a source file.'''
+        stat = os.stat(filename)
+        key = hashlib.blake2b(digest_size=16)
+        for part in (CACHE_VERSION, kind, os.path.abspath(filename), stat.st_size, stat.st_mtime_ns):
+            key.update(str(part).encode() + b'\0')
+        key.update(_content_digest(filename, stat.st_size))
+        return '{}-{}'.format(kind, key.hexdigest())
+
+    def load(self, key):
+        '''Return the arrays saved under key or None.'''
+        path = os.path.join(self.directory, key + '.npz')
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                arrays = {name: saved[name] for name in saved.files}
+        except (OSError, ValueError):
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return arrays
+
+    def save(self, key, arrays):
+        '''Save arrays under key and evict old entries.'''
+        path = os.path.join(self.directory, key + '.npz')
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        # Write to a temporary file so readers never see a partial entry
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp_path, 'wb') as file:
+                file.write(buffer.getbuffer())
+            os.replace(tmp_path, path)
+        except OSError:
+            # The cache is only an optimization so carry on without it
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        '''Remove the least recently used entries until
+        the cache is no larger than max_bytes.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.npz') or path == keep:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        '''Remove every entry from the cache.'''
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.directory, name))
+
+
+def cached_read_sdf(filename, cache, nuclides=None, reactions=None, regions=None):
+    '''Same as scale_plots.sdf.read_sdf but loads the parsed
+    file from cache when it is unchanged. The whole file is
+    cached and the filters are applied after loading.
+    '''
+    if cache is None:
+        return read_sdf(filename, nuclides, reactions, regions)
+    key = cache.key(filename, 'sdf')
+    arrays = cache.load(key)
+    if arrays is None:
+        sdf_data = read_sdf(filename)
+        cache.save(key, _sdf_arrays(sdf_data))
+    else:
+        sdf_data = _sdf_from_arrays(arrays)
+    if nuclides is None and reactions is None and regions is None:
+        return sdf_data
+
+    # Only keep the selected profiles
+    selected = [i for i, key in enumerate(sdf_data['keys']) if _selected(key, nuclides, reactions, regions)]
+    sdf_data['keys'] = [sdf_data['keys'][i] for i in selected]
+    sdf_data['ids'] = sdf_data['ids'][selected]
+    sdf_data['values'] = {name: value[selected] for name, value in sdf_data['values'].items()}
+    return sdf_data
+
+
+def cached_read_coverx(filename, cache, lazy=False, banded=False):
+    '''Same as scale_plots.coverx.read_coverx but loads the
+    parsed file from cache when it is unchanged. Lazy
+    libraries are read from the file itself.
+    '''
+    if cache is None or lazy:
+        return read_coverx(filename, lazy, banded=banded)
+    # Banded libraries are cached as their bands so they are never made dense
+    key = cache.key(filename, 'coverx_banded' if banded else 'coverx')
+    arrays = cache.load(key)
+    if arrays is not None:
+        cov_data = _coverx_from_arrays(arrays)
+    else:
+        cov_data = read_coverx(filename, banded=banded)
+        cache.save(key, _coverx_arrays(cov_data, banded))
+    return cov_data
+
+
+def _content_digest(filename, size, sample=1 << 20):
+    # Hash the start and end of the file so large files are checked quickly
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as file:
+        digest.update(file.read(sample))
+        if size > sample:
+            file.seek(max(sample, size - sample))
+            digest.update(file.read(sample))
+    return digest.digest()
+
+
+def _sdf_arrays(sdf_data):
+    # Flatten the parsed sdf file into arrays for np.savez
+    arrays = {'experiment': np.array(sdf_data['experiment']),
+              'type_a': np.array(sdf_data['type_a']),
+              'type_b': np.array(sdf_data['type_b']),
+              'bounds': sdf_data['groups'].bounds,
+              'keys': np.array(sdf_data['keys'], dtype=str).reshape(-1, 3),
+              'ids': sdf_data['ids']}
+    for name, value in sdf_data['values'].items():
+        arrays['values ' + name] = value
+    return arrays
+
+
+def _sdf_from_arrays(arrays):
+    # Rebuild the read_sdf output from the cached arrays
+    values = {name[len('values '):]: arrays[name] for name in arrays if name.startswith('values ')}
+    # Keep std dev ahead of sensitivity like read_sdf
+    values = {name: values[name] for name in ('std dev', 'sensitivity') if name in values}
+    return {'experiment': str(arrays['experiment']),
+            'type_a': bool(arrays['type_a']),
+            'type_b': bool(arrays['type_b']),
+            'groups': GroupStructure(arrays['bounds']),
+            'keys': [tuple(key) for key in arrays['keys'].tolist()],
+            'ids': arrays['ids'],
+            'values': values}
+
+
+def _coverx_arrays(cov_data, banded=False):
+    # Stack the cross sections and matrices for np.savez
+    groups = cov_data['groups']
+    num_groups = len(groups) - 1
+    mat_xs = cov_data['mat_xs']
+    matrices = cov_data['matrices']
+    arrays = {'groups': groups,
+              'xs_keys': np.array(list(mat_xs.keys()), dtype=np.int64).reshape(-1, 2),
+              'xs': np.array([value['xs'] for value in mat_xs.values()], dtype=np.float32).reshape(-1, num_groups),
+              'std': np.array([value['std'] for value in mat_xs.values()], dtype=np.float32).reshape(-1, num_groups),
+              'matrix_keys': np.array(list(matrices.keys()), dtype=np.int64).reshape(-1, 4)}
+    if banded:
+        # The bands of every matrix one after the other
+        arrays['values'] = np.concatenate([np.zeros(0, dtype=np.float32)] + [matrix.values for matrix in matrices.values()])
+        arrays['indptr'] = np.array([matrix.indptr for matrix in matrices.values()], dtype=np.int64).reshape(-1, num_groups+1)
+        arrays['first'] = np.array([matrix.first for matrix in matrices.values()], dtype=np.int64).reshape(-1, num_groups)
+    else:
+        # The library stores 4 byte floats so nothing is lost
+        arrays['matrices'] = np.array(list(matrices.values()), dtype=np.float32).reshape(-1, num_groups, num_groups)
+    return arrays
+
+
+def _coverx_from_arrays(arrays):
+    # Rebuild the read_coverx output from the cached arrays
+    mat_xs = {}
+    for key, xs, std in zip(arrays['xs_keys'].tolist(), arrays['xs'], arrays['std']):
+        mat_xs[tuple(key)] = {'xs': xs.astype(float), 'std': std.astype(float)}
+    matrices = {}
+    if 'indptr' in arrays:
+        # Rebuild each BandedMatrix from its slice of the bands
+        ends = np.cumsum(arrays['indptr'][:, -1])
+        for key, end, indptr, first in zip(arrays['matrix_keys'].tolist(), ends, arrays['indptr'], arrays['first']):
+            matrices[tuple(key)] = BandedMatrix(arrays['values'][end-indptr[-1]:end], indptr, first)
+    else:
+        for key, matrix in zip(arrays['matrix_keys'].tolist(), arrays['matrices']):
+            matrices[tuple(key)] = matrix.astype(float)
+    return {'groups': arrays['groups'], 'mat_xs': mat_xs, 'matrices': matrices}
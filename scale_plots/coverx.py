@@ -0,0 +1,234 @@
+import mmap
+import numpy as np
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from .banded import BandedMatrix
+
+
+class CoverxMatrices(Mapping):
+    '''Read-only dictionary of the covariance matrices
+    of a COVERX library that are decoded when first used.
+    The file is memory-mapped and only the location of
+    each matrix is found when it is opened. The most
+    recently used matrices are kept in memory.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the covariance file.
+    max_cached : int, optional
+        Number of decoded matrices to keep in memory.
+        Defaults to 128.
+    banded : bool, optional
+        If True the matrices are decoded as
+        BandedMatrix objects. Defaults to False.
+
+    '''
+
+    def __init__(self, filename, max_cached=128, banded=False):
+        self.filename = filename
+        self.max_cached = max_cached
+        self.banded = banded
+        # The memory map stays valid after the file is closed
+        with open(filename, 'rb') as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = _read_header(self._mm)
+        self._directory = _matrix_directory(self._mm, self.header)
+        self._cache = OrderedDict()
+
+    def __getitem__(self, key):
+        key = tuple(key)
+        if key in self._cache:
+            # Mark the matrix as the most recently used
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        header = self.header
+        matrix = _read_matrix(self._mm, self._directory[key], header['num_energy_group'], header['int'], header['float'], self.banded)[1]
+        self._cache[key] = matrix
+        if len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return matrix
+
+    def __contains__(self, key):
+        return tuple(key) in self._directory
+
+    def __iter__(self):
+        return iter(self._directory)
+
+    def __len__(self):
+        return len(self._directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''Release the memory map.'''
+        self._cache.clear()
+        self._mm.close()
+
+
+def read_coverx(filename, lazy=False, max_cached=128, banded=False):
+    '''Parse a scale COVERX covariance library.
+    An exlanation of the file format is located in
+    the parse_coverx jupyter notebook.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the covariance file to parse.
+    lazy : bool, optional
+        If True the matrices are returned as a
+        CoverxMatrices that decodes them when used.
+        Defaults to False.
+    max_cached : int, optional
+        Decoded matrices kept in memory when lazy.
+    banded : bool, optional
+        If True the matrices are stored as
+        scale_plots.banded.BandedMatrix objects that
+        only keep the band of each column.
+        Defaults to False.
+
+    Returns
+    -------
+    cov_data : dict
+        'groups' numpy array of the neutron energy group
+        bounds, 'mat_xs' dictionary of the numpy arrays of
+        cross sections and standard deviations for each
+        (mat, mt) and
+        'matrices' dictionary of the relative covariance
+        matrices for each (mat1, mt1, mat2, mt2).
+
+    '''
+    if lazy:
+        matrices = CoverxMatrices(filename, max_cached, banded)
+        return {'groups': matrices.header['groups'], 'mat_xs': _mat_xs(matrices.header), 'matrices': matrices}
+
+    # Read in and save the full binary file
+    with open(filename, 'rb') as file:
+        full_file = file.read()
+
+    header = _read_header(full_file)
+    num_energy_group = header['num_energy_group']
+
+    # Read in the covariance matrices
+    matrices = {}
+    offset = header['matrices_start']
+    for _ in range(header['num_matrix']):
+        key, matrix, offset = _read_matrix(full_file, offset, num_energy_group, header['int'], header['float'], banded)
+        matrices[key] = matrix
+
+    return {'groups': header['groups'], 'mat_xs': _mat_xs(header), 'matrices': matrices}
+
+
+def _mat_xs(header):
+    # Put the xs and error in a nested dictionary
+    file_xs_dict = {}
+    for mat_mt, xs, std in zip(header['mat_controls'], header['xs'], header['std']):
+        file_xs_dict[mat_mt] = {'xs': xs, 'std': std}
+    return file_xs_dict
+
+
+def _matrix_directory(buffer, header):
+    # Find where the records of every matrix start without decoding them
+    int_type = header['int']
+    directory = {}
+    offset = header['matrices_start']
+    for _ in range(header['num_matrix']):
+        start, _, next_offset = _record(buffer, offset, int_type)
+        key = tuple(np.frombuffer(buffer, dtype=int_type, count=4, offset=start).tolist())
+        directory[key] = offset
+        # Skip the block control and matrix data records
+        offset = _record(buffer, _record(buffer, next_offset, int_type)[2], int_type)[2]
+    return directory
+
+
+def _read_header(buffer):
+    # Read everything ahead of the matrices from the buffer
+    # Find out if the file is big or little endian
+    # Scale decided to switch that for some of their libraries
+    file_id_len = int(np.frombuffer(buffer, dtype='>i4', count=1)[0])
+    # If the length is massive its little-endian
+    sym = '<' if file_id_len > 1000 else '>'
+    int_type = np.dtype(sym + 'i4')
+    float_type = np.dtype(sym + 'f4')
+
+    # Skip the file identification
+    offset = _record(buffer, 0, int_type)[2]
+    # Read in file control values and store important ones
+    start, _, offset = _record(buffer, offset, int_type)
+    file_cont = np.frombuffer(buffer, dtype=int_type, count=7, offset=start)
+    num_energy_group = int(file_cont[0])
+    num_neutron_group = int(file_cont[1])
+    num_mat_mt = int(file_cont[4])
+    num_matrix = int(file_cont[5])
+
+    # Skip the file description
+    offset = _record(buffer, offset, int_type)[2]
+    # Neutron energy group bounds
+    start, _, offset = _record(buffer, offset, int_type)
+    n_groups = np.frombuffer(buffer, dtype=float_type, count=num_neutron_group+1, offset=start).astype(float)
+
+    # Mat ID, Reaction ID, xs weighting option 1-5 for each material reaction
+    start, _, offset = _record(buffer, offset, int_type)
+    mat_controls = np.frombuffer(buffer, dtype=int_type, count=3*num_mat_mt, offset=start).reshape(-1, 3)
+    mat_controls = [tuple(mat_mt) for mat_mt in mat_controls[:, :2].tolist()]
+
+    # One record per material reaction of the cross sections then errors
+    # Read them all at once and drop the record length columns
+    record_len = 2*num_energy_group + 2
+    xs_records = np.frombuffer(buffer, dtype=float_type, count=num_mat_mt*record_len, offset=offset)
+    xs_records = xs_records.reshape(num_mat_mt, record_len)[:, 1:-1].astype(float)
+    offset += num_mat_mt*record_len*4
+
+    return {'int': int_type, 'float': float_type,
+            'num_energy_group': num_energy_group, 'num_matrix': num_matrix,
+            'groups': n_groups, 'mat_controls': mat_controls,
+            'xs': xs_records[:, :num_energy_group], 'std': xs_records[:, num_energy_group:],
+            'matrices_start': offset}
+
+
+def _read_matrix(buffer, offset, num_energy_group, int_type, float_type, banded=False):
+    # Decode the matrix whose records start at offset
+    # Read in the matrix control data
+    start, _, offset = _record(buffer, offset, int_type)
+    mat_1, reac_1, mat_2, reac_2, num_blocks = np.frombuffer(buffer, dtype=int_type, count=5, offset=start).tolist()
+
+    # If number of blocks is 2 Scale has updated their files
+    # If this gets raised someone will have to figure out their new format
+    assert num_blocks == 1, 'Scale has updated their format by splitting matrices into blocks.'
+
+    # Values per group and position of diagonal element for each group
+    start, _, offset = _record(buffer, offset, int_type)
+    block_cntrl = np.frombuffer(buffer, dtype=int_type, count=2*num_energy_group, offset=start).reshape(-1, 2)
+    num_vals = block_cntrl[:, 0].astype(np.intp)
+    diag_pos = block_cntrl[:, 1].astype(np.intp)
+
+    # Every column of the matrix stored one after the other
+    start, _, offset = _record(buffer, offset, int_type)
+    values = np.frombuffer(buffer, dtype=float_type, count=int(num_vals.sum()), offset=start)
+
+    cols = np.arange(num_energy_group)
+    if banded:
+        # Keep the band of each column starting from the row of its first value
+        indptr = np.concatenate([[0], np.cumsum(num_vals)])
+        matrix = BandedMatrix(values.astype(np.float32), indptr, cols - diag_pos + 1)
+        return (mat_1, reac_1, mat_2, reac_2), matrix, offset
+
+    # Place the values so the diagonal position is in the diagonal
+    # Element k of a column starting at start goes in row col+(k-start)-diag_pos+1
+    starts = np.cumsum(num_vals) - num_vals
+    rows = np.arange(len(values)) - np.repeat(starts - cols + diag_pos - 1, num_vals)
+    matrix = np.zeros((num_energy_group, num_energy_group), dtype=float)
+    matrix[rows, np.repeat(cols, num_vals)] = values
+    return (mat_1, reac_1, mat_2, reac_2), matrix, offset
+
+
+def _record(buffer, offset, int_type):
+    # Fortran records are wrapped in their length in bytes
+    # Return the start and end of the data and the start of the next record
+    length = int(np.frombuffer(buffer, dtype=int_type, count=1, offset=offset)[0])
+    return offset + 4, offset + 4 + length, offset + length + 8
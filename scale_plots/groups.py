@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class GroupStructure():
+    '''Energy group structure stored as float arrays.
+    Groups are ordered from highest to lowest energy
+    as they are in the scale files.
+
+    Parameters
+    ----------
+    bounds : array_like
+        The num_groups+1 energy boundaries in eV
+        from highest to lowest.
+
+    '''
+
+    def __init__(self, bounds):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        # Upper and lower bound of every group
+        self.upper = self.bounds[:-1]
+        self.lower = self.bounds[1:]
+        # Lethargy width of every group
+        self.lethargy = np.log(self.upper / self.lower)
+
+    def __len__(self):
+        return len(self.upper)
+
+    def __eq__(self, other):
+        return isinstance(other, GroupStructure) and np.array_equal(self.bounds, other.bounds)
+
+    def step_bounds(self, groups=slice(None)):
+        '''Return the upper then lower bound of each 
+        group, the x values of a step plot.'''
+        return np.column_stack([self.upper[groups], self.lower[groups]]).ravel()
+
+    def window(self, elow=float('-inf'), ehigh=float('inf')):
+        '''Return the slice of groups with an upper bound
+        of at most ehigh and a lower bound of at least elow.
+
+        Parameters
+        ----------
+        elow : float, optional
+            The low bound for energies. Defaults to -inf.
+        ehigh : float, optional
+            The high bound for energies. Defaults to inf.
+
+        Returns
+        -------
+        groups : slice
+            Indices of the groups inside the window.
+
+        '''
+        # The bounds are descending so search the negated values
+        first = np.searchsorted(-self.upper, -ehigh, side='left')
+        last = np.searchsorted(-self.lower, -elow, side='right')
+        return slice(int(first), int(max(first, last)))
+
+
+def step_values(values):
+    '''Repeat each group value twice to match the
+    x values from GroupStructure.step_bounds.'''
+    return np.repeat(values, 2, axis=-1)
@@ -0,0 +1,248 @@
+import numpy as np
+
+from .groups import step_values
+
+
+class PlotData():
+    '''The numbers behind the plots of a
+    scale_plots.Plots object without drawing them.
+    Every array the plot functions draw is returned
+    so the data can be used without matplotlib.
+
+    Parameters
+    ----------
+    plots : scale_plots.Plots
+        Object holding the loaded sdf and
+        covariance files.
+
+    '''
+
+    def __init__(self, plots):
+        self.plots = plots
+
+    def sensitivity(self, keys, elow=float('-inf'), ehigh=float('inf'), lethargy=False, corr=False):
+        '''Return the step plot data of the sensitivities
+        for the given keys.
+
+        Parameters
+        ----------
+        keys : list of lists
+            Indices in the pandas DataFrame where the desired
+            sensitivities are stored.
+        elow : float, optional
+            The low bound for energies. Defaults to -inf.
+        ehigh : float, optional
+            The high bound for energies. Defaults to inf.
+        lethargy : bool, optional
+            Whether to return sensitivities per unit
+            lethargy. Defaults to False.
+        corr : bool, optional
+            Whether to calculate the correlation matrix
+            of the keys. Defaults to False.
+
+        Returns
+        -------
+        data : dict
+            'curves' list with a dictionary for each key of
+            'key',
+            'energy' and 'sens_step' the x and y values of
+            the step plot,
+            'std_step' the std devs for each step value,
+            'mid_energy' the log center of each group,
+            'sens' and 'std' the values of each group,
+            'integral' and 'integral_unc' the integral value
+            and its uncertainty.
+            The std dev values are None for type A files.
+            'corr' (num keys, num keys) correlation matrix
+            or None.
+
+        '''
+        import pandas as pd
+        plots = self.plots
+        # Make sure keys is a list of lists
+        if type(keys[0]) is not list:
+            keys = [keys]
+        # The energy bounds of each experiment
+        windows = {}
+        for exp in set(key[0] for key in keys):
+            # Only use the energy groups within given elow and ehigh
+            groups = plots.get_groups(exp)
+            window = groups.window(elow, ehigh)
+            index = pd.IntervalIndex.from_arrays(groups.lower[window], groups.upper[window], closed='left')
+            windows[exp] = (groups, window, index)
+
+        curves = []
+        for key in keys:
+            # Raise an error if passed in keys are not 4
+            assert len(key) == 4, 'Must pass 4 identifiers in each key'
+            groups, window, index = windows[key[0]]
+            # Collect the the data for the key in given energy bounds and remove NaN
+            key_df = plots.df[key[0]][key[1]][key[2]][key[3]].loc[index].dropna()
+            sens = np.array(key_df['sensitivity'], dtype=float)
+            stdevs = None
+            if len(key_df.columns) == 2:
+                stdevs = np.array(key_df['std dev'], dtype=float)
+
+            # Calculate the sensitivities per lethargy if asked for
+            if lethargy:
+                sens = sens/groups.lethargy[window]
+                if stdevs is not None:
+                    stdevs = stdevs/groups.lethargy[window]
+
+            energy = groups.step_bounds(window)
+            int_value, int_unc = plots.get_integral(key)
+            curves.append({'key': key,
+                           'energy': energy,
+                           'sens_step': step_values(sens),
+                           'std_step': None if stdevs is None else step_values(stdevs),
+                           # Center of each group on a log scale for the error bars
+                           'mid_energy': np.power(10, (np.log10(energy[::2]) + np.log10(energy[1::2]))/2),
+                           'sens': sens,
+                           'std': stdevs,
+                           'integral': int_value,
+                           'integral_unc': int_unc})
+
+        r = plots.get_corr_matrix(keys, elow, ehigh, lethargy) if corr else None
+        return {'curves': curves, 'corr': r}
+
+    def heatmap(self, mat_mt_1, mat_mt_2, filename, covariance=True, elow=float('-inf'), ehigh=float('inf')):
+        '''Return the covariance or correlation matrix
+        between two material reactions inside an
+        energy window.
+
+        Parameters
+        ----------
+        mat_mt_1, mat_mt_2 : tuple
+            The material and reaction id numbers.
+        filename : str
+            Name of the covariance file.
+        covariance : bool, optional
+            If true the covariance matrix is returned.
+            If false the correlation matrix is returned.
+        elow : float, optional
+            The low bound for energies. Defaults to -inf.
+        ehigh : float, optional
+            The high bound for energies. Defaults to inf.
+
+        Returns
+        -------
+        data : dict
+            'pair' the (mat1, mt1, mat2, mt2) key of the matrix,
+            'matrix' the dense matrix of the groups in the window,
+            'groups' the index of each of those groups,
+            'max_bounds' the upper energy bound of each group and
+            'kind' either 'Covariance' or 'Correlation'.
+
+        '''
+        plots = self.plots
+        # Figure out which nuclide and reaction should come first in the key
+        mat_mt_pair = plots.get_cov_pair(filename, mat_mt_1, mat_mt_2)
+        assert mat_mt_pair is not None, 'Material and Reaction pairs not found'
+
+        indices, max_bounds = self._cov_window(filename, elow, ehigh)
+        # The window is a contiguous run of groups
+        window = slice(indices[0], indices[-1]+1)
+
+        matrix_full = plots.get_matrix(filename, mat_mt_pair, covariance)
+        return {'pair': mat_mt_pair,
+                'matrix': np.asarray(matrix_full[window, window]),
+                'groups': indices,
+                'max_bounds': max_bounds,
+                'kind': 'Covariance' if covariance else 'Correlation'}
+
+    def block_heatmap(self, filename, mats, mts=None, covariance=True, elow=float('-inf'), ehigh=float('inf')):
+        '''Return the block covariance or correlation matrix
+        of the reactions of the given materials inside an
+        energy window. See Plots.get_block_matrix.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the covariance file.
+        mats : int, str or list
+            Material id numbers or names.
+        mts : list of int, optional
+            Reactions to include in the given order.
+            Defaults to every reaction of each material.
+        covariance : bool, optional
+            If true the covariance matrix is returned.
+            If false the correlation matrix is returned.
+        elow : float, optional
+            The low bound for energies. Defaults to -inf.
+        ehigh : float, optional
+            The high bound for energies. Defaults to inf.
+
+        Returns
+        -------
+        data : dict
+            'mat_mts' the (mat, mt) of each block,
+            'matrix' the matrix of the groups in the window
+            of every block,
+            'groups' the index of each of those groups,
+            'max_bounds' the upper energy bound of each group and
+            'kind' either 'Covariance' or 'Correlation'.
+
+        '''
+        indices, max_bounds = self._cov_window(filename, elow, ehigh)
+        matrix_full, mat_mts = self.plots.get_block_matrix(filename, mats, mts, covariance)
+        # Rows of the groups in the window of every block
+        num_groups = len(self.plots.cov_groups[filename]) - 1
+        rows = (num_groups*np.arange(len(mat_mts))[:, np.newaxis] + indices).ravel()
+        return {'mat_mts': mat_mts,
+                'matrix': matrix_full[np.ix_(rows, rows)],
+                'groups': indices,
+                'max_bounds': max_bounds,
+                'kind': 'Covariance' if covariance else 'Correlation'}
+
+    def _cov_window(self, filename, elow, ehigh):
+        # Index and upper bound of the covariance groups between elow and ehigh
+        max_bounds_full = self.plots.cov_groups[filename][:-1]
+        in_window = (max_bounds_full <= ehigh) & (max_bounds_full > elow)
+        indices = np.flatnonzero(in_window)
+        assert len(indices) > 0, 'No energy groups between {} and {}'.format(elow, ehigh)
+        return indices, max_bounds_full[in_window]
+
+
+def block_reduce(matrix, max_size, reduce='mean'):
+    '''Shrink a matrix by combining square blocks of
+    elements so neither side is longer than max_size.
+    Blocks on the last rows and columns may be partial.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        The matrix to shrink.
+    max_size : int
+        Largest number of rows or columns to return.
+    reduce : str, optional
+        'mean' for the mean of each block or 'maxabs'
+        for the value with the largest magnitude.
+        Defaults to 'mean'.
+
+    Returns
+    -------
+    reduced : numpy.ndarray
+        The matrix of the combined blocks.
+    factor : int
+        Number of rows and columns in each block.
+
+    '''
+    assert reduce in ('mean', 'maxabs'), "reduce must be either 'mean' or 'maxabs' not '{}'".format(reduce)
+    matrix = np.asarray(matrix, dtype=float)
+    factor = max(1, -(-max(matrix.shape) // max(1, int(max_size))))
+    if factor == 1:
+        return matrix, 1
+    # Pad with zeros to whole blocks and put each block's values on the last axis
+    num_rows = -(-matrix.shape[0] // factor)
+    num_cols = -(-matrix.shape[1] // factor)
+    padded = np.zeros((num_rows*factor, num_cols*factor))
+    padded[:matrix.shape[0], :matrix.shape[1]] = matrix
+    blocks = padded.reshape(num_rows, factor, num_cols, factor).transpose(0, 2, 1, 3).reshape(num_rows, num_cols, -1)
+    if reduce == 'maxabs':
+        # Zero padding never has the largest magnitude
+        largest = np.abs(blocks).argmax(axis=-1)
+        return np.take_along_axis(blocks, largest[..., np.newaxis], axis=-1)[..., 0], factor
+    # Only count the elements inside the matrix
+    row_counts = np.minimum(factor, matrix.shape[0] - factor*np.arange(num_rows))
+    col_counts = np.minimum(factor, matrix.shape[1] - factor*np.arange(num_cols))
+    return blocks.sum(axis=-1) / np.outer(row_counts, col_counts), factor
@@ -1,25 +1,94 @@
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from math import ceil, log
-from scipy.stats import pearsonr
-from struct import unpack
+# pandas and matplotlib are imported by the functions that use them
+# so parsing files only needs numpy
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import os
 
 import scale_plots
 from .scale_ids import mt_ids, elements, specials
+from .sdf import profile_index, read_profile
+from .groups import GroupStructure
+from .banded import BandedMatrix
+from .plot_data import PlotData, block_reduce
+from .sandwich import sandwich_matrix, init_worker, sandwich_rows
+from .cache import DiskCache, cached_read_sdf, cached_read_coverx
 
 class Plots():
     '''Object that contains the functions needed 
     to parse and plot the data from a sdf file.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Directory to cache parsed sdf and covariance 
+        files in. Unchanged files are loaded from the 
+        cache instead of being parsed again. 
+        Defaults to no caching.
+    cache_max_bytes : int, optional
+        Size limit of the cache. The least recently 
+        used files are removed past it. Defaults to 2 GB.
+
     '''
 
-    def __init__(self):
-        self.df = None
+    def __init__(self, cache_dir=None, cache_max_bytes=2*1024**3):
+        # Optional on-disk cache of parsed files
+        self.cache = None if cache_dir is None else DiskCache(cache_dir, cache_max_bytes)
+        # Parsed sdf files in load order and the DataFrame built from them
+        self.sdf_blocks = []
+        self._df = None
+        self._df_blocks = 0
+        # Integral of every loaded profile and the files it includes
+        self._integrals = None
+        self._integral_blocks = 0
+        # Running sums of the sensitivities for top_sensitivities
+        self._query_blocks = []
+        # Profile offset indices of sdf files read with get_profile
+        self._profile_indices = {}
         self.cov_matrices = {}
         self.cov_groups = {}
         self.mat_xs = {}
-
-    def sdf_to_df(self, filename):
+        # Pair, partner and name lookups for each covariance file
+        self.cov_index = {}
+        # Most recently used correlation matrices for each (file, pair)
+        self._corr_matrices = OrderedDict()
+        self._max_corr_cached = 128
+        # Arrays behind the plots without matplotlib
+        self.plot_data = PlotData(self)
+
+    @property
+    def df(self):
+        '''pandas.DataFrame of every loaded sdf file. 
+        Files loaded since the last time the DataFrame 
+        was read are concatenated onto it in one step.
+        '''
+        import pandas as pd
+        if self._df_blocks < len(self.sdf_blocks):
+            # Frames built by sdf_to_df are only needed until they are combined
+            frames = [sdf_data.pop('frame') if 'frame' in sdf_data else self.__sdf_frame(sdf_data)
+                      for sdf_data in self.sdf_blocks[self._df_blocks:]]
+            if self._df is not None:
+                frames = [self._df] + frames
+            if len(frames) == 1:
+                self._df = frames[0]
+            else:
+                # Concatenate all of the new DataFrames at once
+                self._df = pd.concat(frames, axis=1)
+            self._df_blocks = len(self.sdf_blocks)
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        # Replacing the DataFrame drops the parsed files behind it
+        self.sdf_blocks = []
+        self._df = df
+        self._df_blocks = 0
+        # Integrals of a given DataFrame come from its columns
+        self._integrals = None if df is None else self.__df_integral_frame(df)
+        self._integral_blocks = 0
+        self._query_blocks = []
+
+    def sdf_to_df(self, filename, nuclides=None, reactions=None, regions=None):
         '''Parse the keno sdf output file into 
         a pandas DataFrame.
 
@@ -27,94 +96,138 @@ class Plots():
         ----------
         filename : str
             Name of the sdf file to parse.
+        nuclides : set or callable, optional
+            Nuclide names to load, or a function that 
+            takes a nuclide name and returns True to load 
+            it. Profiles that are not selected are skipped 
+            without being decoded. Defaults to every nuclide.
+        reactions : set or callable, optional
+            Same as nuclides but for the reaction names.
+        regions : set or callable, optional
+            Same as nuclides but for the unit and region 
+            names as they appear in the DataFrame.
 
         Returns
         -------
         df : pandas.DataFrame
             DataFrame containing all of the data 
-            needed for plotting from the sdf file.
+            needed for plotting from this sdf file 
+            only. The data from every loaded file 
+            is combined in Plots.df.
 
         '''
-        data = {}
         # Check for an sdf file
         if filename[-4:] != '.sdf':
             print("File must be a '.sdf' file.")
             return
-        experiment = filename[:-4].split('/')[-1]
-        type_a = False
-        type_b = False
-        with open(filename, 'r') as file:
-            lines = file.readlines()
-
-            # Read in the header data
-            num_neutron_groups = int(lines[1].split()[0])
-            num_sens_profiles = int(lines[2].split()[0])
-            #num_nuc_integrated = int(lines[2].split()[5])
-            #data[(experiment, 'keff', 'value')] = float(lines[3].split()[0])
-            #data[(experiment, 'keff', 'std dev')] = float(lines[3].split()[2])
-
-            # Collect the engergy boundaries
-            lines_energy_bound = ceil((num_neutron_groups+1) / 5)
-            energy_bounds = []
-            bounds = ''.join(lines[5 : 5+lines_energy_bound]).split()
-            # Loop through the lines of energy group numbers
-            for i in range(num_neutron_groups):
-                bound = '{}:{}'.format(bounds[i],bounds[i+1])
-                energy_bounds.append(bound)
-            # Number of lines each profile has of sensitivity values
-            lines_values = ceil(num_neutron_groups/5)
-            # Number of lines each sensitivity profile takes
-            if len(lines[lines_energy_bound + 5].split()) == 6:
-                # Type A
-                lines_profile = lines_values + 2
-                type_a = True
-            elif len(lines[lines_energy_bound + 5].split()) == 4:
-                # Type B
-                lines_profile = 2 * lines_values + 4
-                type_b = True
-            # Place the sensitivities into a dictionary of 2xn numpy arrays
-            for i in range(num_sens_profiles):
-                # Grab the identifying keys for the sensitivities
-                key_start = lines_energy_bound + 5 + i * lines_profile
-                nuclide = lines[key_start].split()[0]
-                interaction = lines[key_start].split()[1]
-                # Check if the file is type A or type B
-                if type_a:
-                    #  Type A
-                    unit_region = lines[key_start].split()[4]
-
-                    # Setup the sensitivity data
-                    sens_start = key_start+2
-                elif type_b:
-                    # Type B
-                    unit_num = lines[key_start+1].split()[0]
-                    region_num = lines[key_start+1].split()[1]
-                    unit_region = '({},{})'.format(unit_num, region_num)
-
-                    # Type A has no stdev so grab it here
-                    sens_start = key_start+4
-                    stdevs = ''.join(lines[sens_start+lines_values : key_start+lines_profile]).split()
-                    data[(experiment, nuclide, interaction, unit_region, 'std dev')] = np.array(stdevs, dtype=float)
-                # Place the sensitivities into the dictionary
-                sens = ''.join(lines[sens_start : sens_start+lines_values]).split()
-                data[(experiment, nuclide, interaction, unit_region, 'sensitivity')] = np.array(sens, dtype=float)
-
-        # Create or append the dataframe indexed by energy groups
-        if self.df is None:
-            self.df = pd.DataFrame(data, index=energy_bounds)
-            # Name the idices and columns
-            self.df.index.name = 'energy bounds (ev)'
-            if type_a:
-                self.df.columns.names = ['experiment', 'isotope', 'reaction', '(unit, region)', '']
-            elif type_b:
-                self.df.columns.names = ['experiment', 'isotope', 'reaction', 'region', '']
+        sdf_data = cached_read_sdf(filename, self.cache, nuclides, reactions, regions)
+        self.add_sdf(sdf_data)
+        # Keep the frame so Plots.df does not build it again
+        sdf_data['frame'] = self.__sdf_frame(sdf_data)
+        return sdf_data['frame']
+
+    def add_sdf(self, sdf_data):
+        '''Add an sdf file that was already parsed, 
+        e.g. by scale_plots.cache.cached_read_sdf in 
+        another thread, to the loaded data.
+
+        Parameters
+        ----------
+        sdf_data : dict
+            Parsed file from scale_plots.sdf.read_sdf.
+
+        '''
+        self.sdf_blocks.append(sdf_data)
+
+    def load_sdfs(self, filenames, workers=None, nuclides=None, reactions=None, regions=None):
+        '''Parse many sdf files in a process pool and add 
+        them to the loaded data. Columns are added to 
+        the DataFrame in the order of the given filenames.
+
+        Parameters
+        ----------
+        filenames : list of str
+            Names of the sdf files to parse.
+        workers : int, optional
+            Number of processes to parse with. Defaults 
+            to the number of CPUs. If 1 the files are 
+            parsed in this process.
+        nuclides, reactions, regions : set or callable, optional
+            Filters on the profiles to load. See sdf_to_df. 
+            Functions must be picklable when workers is not 1.
+
+        Returns
+        -------
+        errors : dict
+            key : filename that could not be parsed 
+            value : description of the error
+
+        '''
+        errors = {}
+        parsed = {}
+        # Check for sdf files
+        filenames = list(filenames)
+        for filename in filenames:
+            if filename[-4:] != '.sdf':
+                errors[filename] = "File must be a '.sdf' file."
+        to_read = [filename for filename in filenames if filename not in errors]
+
+        if workers == 1:
+            for filename in to_read:
+                try:
+                    parsed[filename] = cached_read_sdf(filename, self.cache, nuclides, reactions, regions)
+                except Exception as err:
+                    errors[filename] = '{}: {}'.format(type(err).__name__, err)
         else:
-            # Concatenate current DataFrame with new DataFrame
-            new_df = pd.DataFrame(data, index=energy_bounds)
-            self.df = pd.concat([self.df, new_df], axis=1)
-        return self.df
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {filename: pool.submit(cached_read_sdf, filename, self.cache, nuclides, reactions, regions) for filename in to_read}
+                for filename, future in futures.items():
+                    try:
+                        parsed[filename] = future.result()
+                    except Exception as err:
+                        errors[filename] = '{}: {}'.format(type(err).__name__, err)
+
+        # Report the files that failed without stopping the others
+        errors = {filename: errors[filename] for filename in filenames if filename in errors}
+        for filename, error in errors.items():
+            print('Could not parse {}. {}'.format(filename, error))
+        self.sdf_blocks.extend(parsed[filename] for filename in to_read if filename in parsed)
+        return errors
+
+    def get_profile(self, filename, key):
+        '''Read a single sensitivity profile from an sdf 
+        file without parsing the rest of the file. The 
+        offset of every profile is indexed on the first 
+        call and saved next to the file as filename + '.idx'.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the sdf file.
+        key : list
+            (isotope, reaction, unit_region) of the profile. 
+            The experiment may be given first like the 
+            keys of the DataFrame.
 
-    def parse_coverx(self, filename):
+        Returns
+        -------
+        groups : scale_plots.groups.GroupStructure
+            Energy groups of the profile.
+        values : dict
+            'sensitivity' and, for type B files, 'std dev' 
+            numpy arrays with one value per energy group.
+
+        '''
+        if len(key) == 4:
+            key = key[1:]
+        # Reuse the index unless the file has changed
+        stat = os.stat(filename)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if filename not in self._profile_indices or self._profile_indices[filename][0] != stamp:
+            self._profile_indices[filename] = (stamp, profile_index(filename))
+        return read_profile(filename, key, self._profile_indices[filename][1])
+
+    def parse_coverx(self, filename, lazy=False, banded=False):
         '''Parse the covariance matrix file. Save the 
         matrices into a dictionary as well as the 
         energy groups. 
@@ -125,6 +238,18 @@ class Plots():
         ----------
         filename : str
             Name of the covariance file to parse.
+        lazy : bool, optional
+            If True only the location of each matrix 
+            is read. Matrices are decoded from the 
+            memory-mapped file when first used and the 
+            most recently used ones are kept in memory. 
+            Use for fine group libraries that do not fit 
+            in memory. Defaults to False.
+        banded : bool, optional
+            If True each matrix is stored as a 
+            scale_plots.banded.BandedMatrix that only 
+            keeps the band of values in each column. 
+            Slicing gives dense arrays. Defaults to False.
 
         '''
         fname = filename.split('/')[-1]
@@ -132,138 +257,139 @@ class Plots():
         if fname[0:6] != 'scale.' and 'groupcov' not in fname:
             print('File must be a scale covariance file.')
             return
-        # Read in and save the full binary file
-        with open(filename, 'rb') as file:
-            full_file = file.read()
-
-        # Read the file identification length in bytes to skip
-        # Find out if the file is big or little endian
-        # Scale decided to switch that for some of their libraries
-        file_id_len = unpack('>i', full_file[0:4])[0]
-        # If the length is massive its little-endian
-        if file_id_len > 1000:
-            sym = '<'
-            file_id_len = unpack('<i', full_file[0:4])[0]
-        else:
-            sym = '>'
-
-        # Start is file id length + 3 integers for sections length
-        file_cont_st = file_id_len + 12
-        # File control should always be 28 bytes
-        file_cont_end = file_cont_st + 28
-        # Read in file control values and store important ones
-        file_cont = unpack(sym+'iiiiiii', full_file[file_cont_st: file_cont_end])
-        num_energy_group = file_cont[0]
-        num_neutron_group = file_cont[1]
-        num_mat_mt = file_cont[4]
-        num_matrix = file_cont[5]
-
-        # Read file description length to skip it
-        file_desc_len = unpack(sym+'i', full_file[file_cont_end+4:file_cont_end+8])[0]
-
-        n_start = file_cont_end + 8 + file_desc_len + 8
-        n_end = n_start + (num_neutron_group+1)*4
-        n_string = sym + 'f'*(num_neutron_group+1)
-        n_groups = np.array(unpack(n_string, full_file[n_start:n_end]))
-        n_end += 4
-        
+        cov_data = cached_read_coverx(filename, self.cache, lazy, banded)
+        self.add_coverx(filename, cov_data)
+
+    def add_coverx(self, filename, cov_data):
+        '''Add a covariance file that was already parsed, 
+        e.g. by scale_plots.cache.cached_read_coverx in 
+        another thread, to the loaded data.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the parsed covariance file.
+        cov_data : dict
+            Parsed file from scale_plots.coverx.read_coverx.
+
+        '''
+        fname = filename.split('/')[-1]
+        # Forget correlations calculated from an older parse of the file
+        self._corr_matrices = OrderedDict((key, corr) for key, corr in self._corr_matrices.items() if key[0] != fname)
         # Add the neutron groups to the groups dictionary
-        self.cov_groups[fname] = n_groups
-
-        # Read in the material reaction control data
-        mat_controls = []
-        for i in range(num_mat_mt):
-            # Setup for 3 integers
-            mat_start = n_end + 4 + i*12
-            mat_end = mat_start + 8
-            # Mat ID, Reaction ID, xs weighting option 1-5
-            mat_controls.append(unpack(sym+'ii', full_file[mat_start:mat_end]))
-        mat_end += 4
-
-        # Read in the material cross sections and errors into a nested dict
-        file_xs_dict = {}
-        # Iterate through all material reactions
-        for i in range(num_mat_mt):
-            file_mat_xs = {}
-            # Setup for number of energy groups floats
-            xs_start = mat_end + i*(num_energy_group+1)*8 + 8
-            xs_end = xs_start + num_energy_group*4
-            xs_string = sym + 'f'*num_energy_group
-            # Read in the cross sections for current material reaction
-            file_mat_xs['xs'] = list(unpack(xs_string, full_file[xs_start:xs_end]))
-            
-            # Setup for number of energy groups floats
-            err_start = xs_end
-            err_end = err_start + num_energy_group*4
-            err_string = xs_string
-            # Read in the cross section errors for current material reaction
-            file_mat_xs['std'] = list(unpack(err_string, full_file[err_start:err_end]))
-            
-            # Put the xs and error in the full xs dictionary
-            file_xs_dict[mat_controls[i]] = file_mat_xs
-
-        err_end += 4
+        self.cov_groups[fname] = cov_data['groups']
         # Put the xs information in the saved dictionary
-        self.mat_xs[fname] = file_xs_dict
-
-        # Start prev_end at start of the matrices section
-        prev_end = err_end
-        # Read in the covariance matrices
-        matrices = {}
-        for _ in range(num_matrix):
-            # Read in the matrix control data
-            # Setup to read 5 integers
-            matrix_cntrl_start = prev_end + 4
-            matrix_cntrl_end = matrix_cntrl_start + 20
-            matrix_cntrl = unpack(sym+'iiiii', full_file[matrix_cntrl_start:matrix_cntrl_end])
-            mat_1 = matrix_cntrl[0]
-            reac_1 = matrix_cntrl[1]
-            mat_2 = matrix_cntrl[2]
-            reac_2 = matrix_cntrl[3]
-            num_blocks = matrix_cntrl[4]
-
-            # If number of blocks is 2 Scale has updated their files
-            # If this gets raised someone will have to figure out their new format
-            assert num_blocks == 1, 'Scale has updated their format by splitting matrices into blocks.'
-
-            # Iterate past number of bytes value
-            matrix_cntrl_end += 4
-
-            # Read in the block control values
-            block_cntrl = []
-            # Iterate past the number of bytes in block control value
-            block_cntrl_start = matrix_cntrl_end + 4
-            block_cntrl_end = block_cntrl_start + 2*num_energy_group*4 + 8
-            # Iterate through all energy groups
-            for j in range(num_energy_group):
-                start = block_cntrl_start + j*8
-                # Values per group and position of diagonal element for group
-                block_cntrl.append(unpack(sym+'ii', full_file[start:start+8]))
-
-            # Read in the relative covariance matrix
-            matrix_start = block_cntrl_end + 4
-            prev_read = 0
-            # Initialize the matrix to an array of zeros
-            matrix = np.zeros((num_energy_group, num_energy_group), dtype=float)
-            col = 0
-            # For each energy grouping
-            for num_vals, diag_pos in block_cntrl:
-                # Read in each energy group's column
-                start = matrix_start + prev_read
-                end = start + num_vals*4
-                string = sym + 'f'*num_vals
-                full_col = unpack(string, full_file[start:end])
-                for row in range(num_vals):
-                    # Place the values so the diagonal position is in the diagonal
-                    matrix[col+row-diag_pos+1][col] = full_col[row]
-                # Update the previous read value to past this energy groups
-                prev_read += num_vals*4
-                col += 1
-            matrices[(mat_1, reac_1, mat_2, reac_2)] = matrix
-            prev_end = end + 4
-
+        self.mat_xs[fname] = cov_data['mat_xs']
         # Save the covariance matrices for this file
-        self.cov_matrices[fname] = matrices
+        self.cov_matrices[fname] = cov_data['matrices']
+        # Index the pairs so lookups do not scan every matrix
+        self.cov_index[fname] = self.__cov_index(cov_data['matrices'].keys())
+
+    def get_cov_pair(self, filename, mat_mt_1, mat_mt_2):
+        '''Return the key of the covariance matrix 
+        between two material reactions in either order.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the covariance file.
+        mat_mt_1 : tuple
+            The material and reaction id number 
+            for one of the cross sections.
+        mat_mt_2 : tuple
+            The material and reaction id number 
+            for the second cross section.
+
+        Returns
+        -------
+        mat_mt_pair : tuple or None
+            (mat1, mt1, mat2, mt2) key of the matrix 
+            in Plots.cov_matrices or None if the file 
+            has no matrix for the pair.
+
+        '''
+        return self.cov_index[filename]['pairs'].get(tuple(mat_mt_1) + tuple(mat_mt_2))
+
+    def get_matrix(self, filename, mat_mt_pair, covariance=True):
+        '''Return the covariance or correlation matrix 
+        stored under a key of Plots.cov_matrices.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the covariance file.
+        mat_mt_pair : tuple
+            (mat1, mt1, mat2, mt2) key of the matrix. 
+            See get_cov_pair.
+        covariance : bool, optional
+            If true the covariance matrix is returned. 
+            If false the correlation matrix is returned.
+
+        Returns
+        -------
+        matrix : numpy.ndarray or scale_plots.banded.BandedMatrix
+            The full matrix in the format it was parsed in.
+
+        '''
+        if covariance:
+            return self.cov_matrices[filename][mat_mt_pair]
+        return self.__cov_to_corr(mat_mt_pair, filename)
+
+    def get_block_matrix(self, filename, mats, mts=None, covariance=True):
+        '''Assemble the covariance or correlation matrix 
+        between every pair of reactions of the given 
+        materials as one matrix of blocks. Block (i, j) 
+        is the matrix between reactions i and j and the 
+        blocks of reversed pairs are the transposes of 
+        the stored matrices. Pairs without a matrix in 
+        the file are zero.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the covariance file.
+        mats : int, str or list
+            Material id numbers or names.
+        mts : list of int, optional
+            Reactions to include in the given order. 
+            Reactions a material does not have are left 
+            out. Defaults to every reaction of each material.
+        covariance : bool, optional
+            If true the covariance matrix is assembled. 
+            If false the correlation matrix is assembled.
+
+        Returns
+        -------
+        matrix : numpy.ndarray
+            (num reactions * num groups, num reactions * num groups) 
+            matrix with the groups of each reaction together.
+        mat_mts : list of tuple
+            The (mat, mt) of each block in order.
+
+        '''
+        cov_index = self.cov_index[filename]
+        if isinstance(mats, (int, str)):
+            mats = [mats]
+        # Translate names into ids
+        mats = [cov_index['mat_ids'].get(mat, mat) for mat in mats]
+        mat_mts = []
+        for mat in mats:
+            assert mat in cov_index['reactions'], 'Material {} not found in {}'.format(mat, filename)
+            reactions = cov_index['reactions'][mat]
+            mat_mts.extend((mat, mt) for mt in (sorted(reactions) if mts is None else mts) if mt in reactions)
+
+        num_groups = len(self.cov_groups[filename]) - 1
+        matrix = np.zeros((len(mat_mts)*num_groups, len(mat_mts)*num_groups))
+        position = {mat_mt: i for i, mat_mt in enumerate(mat_mts)}
+        for mat_mt_pair in self.__cov_pairs(filename, position):
+            block = np.asarray(self.get_matrix(filename, mat_mt_pair, covariance))
+            i = position[mat_mt_pair[:2]]*num_groups
+            j = position[mat_mt_pair[2:]]*num_groups
+            matrix[i:i+num_groups, j:j+num_groups] = block
+            # Fill in the reversed pair from the stored matrix
+            if i != j:
+                matrix[j:j+num_groups, i:i+num_groups] = block.T
+        return matrix, mat_mts
 
     def get_mat_name(self, matid):
         '''Translate the material ID into 
@@ -296,6 +422,34 @@ class Plots():
         '''
         return mt_ids[mtid]
 
+    def get_groups(self, experiment):
+        '''Return the energy group structure 
+        of a loaded experiment.
+
+        Parameters
+        ----------
+        experiment : str
+            Name of the experiment in the DataFrame.
+
+        Returns
+        -------
+        groups : scale_plots.groups.GroupStructure
+            Upper and lower bounds and lethargy 
+            widths of the experiment's energy groups.
+        '''
+        for sdf_data in reversed(self.sdf_blocks):
+            if sdf_data['experiment'] == experiment:
+                return sdf_data['groups']
+        # A DataFrame given to Plots.df has no parsed files so use its index
+        if self.df is None or experiment not in self.df.columns.get_level_values(0):
+            raise KeyError('Experiment {} has not been loaded.'.format(experiment))
+        index = self.df[experiment].dropna(how='all').index
+        upper = np.asarray(index.right, dtype=float)
+        lower = np.asarray(index.left, dtype=float)
+        # Highest energy group first like the sdf files
+        order = np.argsort(-upper, kind='stable')
+        return GroupStructure(np.append(upper[order], lower[order][-1]))
+
     def get_integral(self, key):
         '''Returns the integral value of the 
         sensitivity data and the uncertainty.
@@ -327,6 +481,105 @@ class Plots():
 
         return int_value, int_unc
 
+    def integrals(self):
+        '''Return the integral sensitivity and its 
+        uncertainty for every loaded profile. The table 
+        is kept and only the files loaded since the last 
+        call are added to it.
+
+        Returns
+        -------
+        integrals : pandas.DataFrame
+            'integral' sum of the sensitivities and 
+            'uncertainty' root sum square of the standard 
+            deviations (NaN for type A files) indexed by 
+            (experiment, isotope, reaction, region).
+
+        '''
+        import pandas as pd
+        if self._integral_blocks < len(self.sdf_blocks) or self._integrals is None:
+            frames = [self.__integral_frame(sdf_data) for sdf_data in self.sdf_blocks[self._integral_blocks:]]
+            if self._integrals is not None:
+                frames = [self._integrals] + frames
+            if len(frames) == 0:
+                # Nothing has been loaded
+                index = pd.MultiIndex.from_tuples([], names=['experiment', 'isotope', 'reaction', 'region'])
+                frames = [pd.DataFrame({'integral': [], 'uncertainty': []}, index=index)]
+            self._integrals = pd.concat(frames) if len(frames) > 1 else frames[0]
+            self._integral_blocks = len(self.sdf_blocks)
+        return self._integrals
+
+    def top_sensitivities(self, n=20, experiments=None, nuclides=None, reactions=None, regions=None,
+                          elow=float('-inf'), ehigh=float('inf'), absolute=True):
+        '''Return the n profiles with the largest sensitivity 
+        summed over an energy window. The running sums of 
+        every profile are calculated once, so each query 
+        only takes two lookups per profile and a partial sort.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of profiles to return. Defaults to 20.
+        experiments : set or callable, optional
+            Experiment names to search, or a function that 
+            takes an experiment name and returns True to 
+            search it. Defaults to every experiment.
+        nuclides, reactions, regions : set or callable, optional
+            Same as experiments for the profile keys.
+        elow : float, optional
+            The low bound for energies to sum. 
+            Defaults to -inf.
+        ehigh : float, optional
+            The high bound for energies to sum. 
+            Defaults to inf.
+        absolute : bool, optional
+            If True rank by the size of the sum, otherwise 
+            by the signed sum. Defaults to True.
+
+        Returns
+        -------
+        top : pandas.DataFrame
+            'sensitivity' sum over the window of the top 
+            profiles in order indexed by (experiment, 
+            isotope, reaction, region).
+
+        '''
+        import pandas as pd
+        self.__update_query_blocks()
+        blocks = []
+        rows = []
+        sums = []
+        for block, (sdf_data, query_block) in enumerate(zip(self.sdf_blocks, self._query_blocks)):
+            if not self.__select(np.array([sdf_data['experiment']]), experiments)[0]:
+                continue
+            # Profiles matching the filters
+            selected = np.ones(len(sdf_data['keys']), dtype=bool)
+            for column, selection in enumerate((nuclides, reactions, regions)):
+                selected &= self.__select(query_block['keys'][:, column], selection)
+            selected = np.flatnonzero(selected)
+            # Sum of the window from the running sums
+            window = sdf_data['groups'].window(elow, ehigh)
+            cumsum = query_block['cumsum']
+            sums.append(cumsum[selected, window.stop] - cumsum[selected, window.start])
+            blocks.append(np.full(len(selected), block))
+            rows.append(selected)
+        sums = np.concatenate(sums) if sums else np.zeros(0)
+        blocks = np.concatenate(blocks) if blocks else np.zeros(0, dtype=int)
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+
+        # Partial sort for the n largest then order them
+        rank = np.abs(sums) if absolute else sums
+        if n < len(rank):
+            top = np.argpartition(-rank, n)[:n]
+        else:
+            top = np.arange(len(rank))
+        top = top[np.argsort(-rank[top], kind='stable')]
+        # Only look up the keys of the top profiles
+        keys = [(self.sdf_blocks[block]['experiment'],) + self.sdf_blocks[block]['keys'][row]
+                for block, row in zip(blocks[top].tolist(), rows[top].tolist())]
+        index = pd.MultiIndex.from_tuples(keys, names=['experiment', 'isotope', 'reaction', 'region'])
+        return pd.DataFrame({'sensitivity': sums[top]}, index=index)
+
     def get_corr(self, keys, elow=float('-inf'), ehigh=float('inf'), lethargy=False):
         '''Return the correlation coefficients for the given keys.
 
@@ -352,25 +605,209 @@ class Plots():
             value : correlation coefficient for the 2 reactions in the key
 
         '''
-        # Get the energy bound indices and lethargies
-        indices, _, lethargies = self.__get_energy_bounds(elow, ehigh)
-        assert len(indices) > 1, 'Must have at least 2 data points to calculate correlation coefficient'
-        # Calculate the pearson correlation coefficient
+        r_matrix = self.get_corr_matrix(keys, elow, ehigh, lethargy)
+        # Every pair of different keys from the full matrix
         r = {}
         for i in range(len(keys)-1):
             for j in range(i+1, len(keys)):
-                # Compare each data set
-                sens_x = np.array(self.df[keys[i][0]][keys[i][1]][keys[i][2]][keys[i][3]]['sensitivity'].loc[indices].dropna(), dtype=float)
-                sens_y = np.array(self.df[keys[j][0]][keys[j][1]][keys[j][2]][keys[j][3]]['sensitivity'].loc[indices].dropna(), dtype=float)
-                if lethargy is False:
-                    sens_x = sens_x/lethargies
-                    sens_y = sens_y/lethargies
-
-                r[(tuple(keys[i]),tuple(keys[j]))] = pearsonr(sens_x, sens_y)[0]
+                r[(tuple(keys[i]),tuple(keys[j]))] = r_matrix[i, j]
         return r
 
+    def get_corr_matrix(self, keys, elow=float('-inf'), ehigh=float('inf'), lethargy=False):
+        '''Return the matrix of correlation coefficients 
+        between every pair of the given keys. All of the 
+        sensitivities are selected from the DataFrame at 
+        once and correlated in one calculation.
+
+        Parameters
+        ----------
+        keys : list of lists
+            Indices in the pandas DataFrame where the desired 
+            data is stored.
+        elow, ehigh, lethargy : optional
+            Same as get_corr.
+
+        Returns
+        -------
+        r : numpy.ndarray
+            (num keys, num keys) pearson correlation 
+            coefficients in the order of the keys.
+
+        '''
+        # Get the energy bound indices and lethargies
+        indices, _, lethargies = self.__get_energy_bounds(elow, ehigh)
+        assert len(indices) > 1, 'Must have at least 2 data points to calculate correlation coefficient'
+        # Select every sensitivity as a (num groups, num keys) array
+        columns = [tuple(key) + ('sensitivity',) for key in keys]
+        sens = np.array(self.df.loc[indices, columns], dtype=float)
+        # Drop the groups outside of the experiments' group structure
+        in_groups = ~np.isnan(sens).any(axis=1)
+        sens = sens[in_groups]
+        if lethargy is False:
+            sens = sens / lethargies[in_groups, np.newaxis]
+        # Calculate the pearson correlation coefficients
+        return np.corrcoef(sens, rowvar=False)
+
+    def propagate_uncertainty(self, experiment, cov_file, region=None, exclude_mts=(1, 3, 27, 101)):
+        '''Propagate the covariance data to the uncertainty 
+        in keff of an experiment with the sandwich rule. 
+        The variance from the covariance matrix between 
+        reactions i and j is S_i C_ij S_j^T where S are the 
+        sensitivity profiles. Profiles are matched to the 
+        matrices by their za and mt numbers. Profiles 
+        without a matrix in the file are left out.
+
+        Parameters
+        ----------
+        experiment : str
+            Name of the loaded experiment.
+        cov_file : str
+            Name of the parsed covariance file. Must have 
+            the same energy groups as the experiment.
+        region : str, optional
+            Unit and region of the profiles to use. 
+            Defaults to the region integrated profiles, 
+            '(0,0)' for type B files and '0' for type A.
+        exclude_mts : tuple, optional
+            Reactions to leave out. Defaults to total, 
+            nonelastic, absorption and capture which 
+            are sums of the other reactions.
+
+        Returns
+        -------
+        contributions : pandas.DataFrame
+            Names, variance and signed relative 
+            uncertainty of every covariance matrix 
+            indexed by (mat1, mt1, mat2, mt2) and 
+            ranked by the size of the variance. 
+            Matrices between two different reactions 
+            count both orders.
+        total : float
+            Relative uncertainty in keff from 
+            all of the matrices. Negative if the 
+            covariance data gives a negative variance.
+
+        '''
+        import pandas as pd
+        sdf_data = self.__sdf_block(experiment)
+        keys = sdf_data['keys']
+        rows = self.__cov_profiles(sdf_data, cov_file, region, exclude_mts)
+        pairs = self.__cov_pairs(cov_file, rows)
+        first = np.array([rows[pair[:2]] for pair in pairs], dtype=int)
+        second = np.array([rows[pair[2:]] for pair in pairs], dtype=int)
+
+        sens = sdf_data['values']['sensitivity']
+        variance = np.zeros(len(pairs))
+        if self.__is_banded(cov_file, pairs):
+            # S_i C_ij S_j^T on the band of each matrix
+            for p, pair in enumerate(pairs):
+                variance[p] = self.cov_matrices[cov_file][pair].sandwich(sens[first[p]], sens[second[p]])
+        else:
+            # S_i C_ij S_j^T for a block of matrices at a time
+            block = 256
+            for start in range(0, len(pairs), block):
+                matrices = np.array([np.asarray(self.cov_matrices[cov_file][pair]) for pair in pairs[start:start+block]])
+                variance[start:start+block] = np.einsum('pg,pgh,ph->p', sens[first[start:start+block]], matrices,
+                                                        sens[second[start:start+block]], optimize=True)
+        # The matrix between different reactions is used for both orders
+        variance[first != second] *= 2
+
+        contributions = pd.DataFrame({'nuclide 1': [keys[i][0] for i in first],
+                                      'reaction 1': [keys[i][1] for i in first],
+                                      'nuclide 2': [keys[i][0] for i in second],
+                                      'reaction 2': [keys[i][1] for i in second],
+                                      'variance': variance,
+                                      'uncertainty': np.sign(variance) * np.sqrt(np.abs(variance))},
+                                     index=pd.MultiIndex.from_tuples(pairs, names=['mat1', 'mt1', 'mat2', 'mt2']))
+        # Rank by the size of each contribution
+        contributions = contributions.iloc[np.argsort(-np.abs(variance), kind='stable')]
+        # Keep the sign if the covariance data gives a negative variance
+        total = np.sign(variance.sum()) * np.sqrt(np.abs(variance.sum()))
+        return contributions, total
+
+    def similarity_matrix(self, cov_file, experiments=None, region=None, exclude_mts=(1, 3, 27, 101),
+                          block_size=64, workers=1):
+        '''Calculate the correlation coefficient c_k between 
+        every pair of experiments. c_k is the covariance 
+        S_a C S_b^T of the keff of two experiments divided by 
+        their uncertainties. The sensitivities of all of the 
+        experiments are stacked into one array and multiplied 
+        with every covariance matrix at once.
+
+        Parameters
+        ----------
+        cov_file : str
+            Name of the parsed covariance file. Must have 
+            the same energy groups as the experiments.
+        experiments : list of str, optional
+            Names of the loaded experiments. Defaults 
+            to every loaded experiment.
+        region, exclude_mts : optional
+            Profiles to use. See propagate_uncertainty.
+        block_size : int, optional
+            Number of experiments in each block of rows.
+        workers : int, optional
+            Number of processes to calculate the blocks 
+            of rows with. If None the number of CPUs. 
+            Defaults to 1 which calculates in this process.
+
+        Returns
+        -------
+        ck : pandas.DataFrame
+            (num experiments, num experiments) c_k values 
+            with the experiment names as the index and 
+            columns. Experiments without an uncertainty 
+            have a c_k of 0.
+
+        '''
+        import pandas as pd
+        if experiments is None:
+            experiments = list(dict.fromkeys(sdf_data['experiment'] for sdf_data in self.sdf_blocks))
+        # Profile of each (za, mt) for every experiment
+        profiles = []
+        for experiment in experiments:
+            sdf_data = self.__sdf_block(experiment)
+            profiles.append((sdf_data, self.__cov_profiles(sdf_data, cov_file, region, exclude_mts)))
+        mat_mts = sorted(set().union(*[rows for _, rows in profiles]))
+        reactions = {mat_mt: i for i, mat_mt in enumerate(mat_mts)}
+        pairs = self.__cov_pairs(cov_file, reactions)
+
+        # Stack the sensitivities as (experiments, reactions, groups)
+        num_groups = len(self.cov_groups[cov_file]) - 1
+        sens = np.zeros((len(experiments), len(reactions), num_groups))
+        for n, (sdf_data, rows) in enumerate(profiles):
+            for mat_mt, row in rows.items():
+                sens[n, reactions[mat_mt]] = sdf_data['values']['sensitivity'][row]
+        first = np.array([reactions[pair[:2]] for pair in pairs], dtype=int)
+        second = np.array([reactions[pair[2:]] for pair in pairs], dtype=int)
+        if self.__is_banded(cov_file, pairs):
+            # Keep the band of each matrix
+            matrices = [self.cov_matrices[cov_file][pair] for pair in pairs]
+        else:
+            matrices = np.zeros((len(pairs), num_groups, num_groups))
+            for p, pair in enumerate(pairs):
+                matrices[p] = np.asarray(self.cov_matrices[cov_file][pair])
+
+        # S_a C S_b^T for one block of rows at a time
+        blocks = [slice(start, start+block_size) for start in range(0, len(experiments), block_size)]
+        if workers == 1:
+            products = [sandwich_matrix(sens[rows], sens, first, second, matrices) for rows in blocks]
+        else:
+            # Send the arrays to each process once instead of with every block
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(sens, first, second, matrices)) as pool:
+                products = list(pool.map(sandwich_rows, blocks))
+        covariance = np.concatenate(products) if products else np.zeros((0, 0))
+
+        # Normalize by the uncertainty of each experiment
+        std = np.sqrt(np.abs(np.diag(covariance)))
+        std_outer = np.outer(std, std)
+        ck = np.divide(covariance, std_outer, out=np.zeros(std_outer.shape), where=std_outer != 0)
+        return pd.DataFrame(ck, index=experiments, columns=experiments)
+
     def sensitivity_plot(self, keys, elow=float('-inf'), ehigh=float('inf'), plot_err_bar=True,
-                         plot_fill_bet=False, plot_corr=False, legend_dict=None, r_pos='bottom right'):
+                         plot_fill_bet=False, plot_corr=False, legend_dict=None, r_pos='bottom right',
+                         save_as=None, show=True, data=None):
         '''Plot the sensitivites for the given isotopes, reactions, 
         unit numbers, and region numbers. Creates a matplotlib.pyplot 
         step plot for the energy bounds from the DataFrame.
@@ -402,16 +839,33 @@ class Plots():
             Where the correlation coefficient should go on the plot. 
             Defaults to 'bottom right'. Can also be 'top right', 
             'bottom left', and 'top left'.
+        save_as : str, optional
+            File to save the figure to. The format comes 
+            from the extension, e.g. '.png', '.pdf' or '.svg'.
+        show : bool, optional
+            Whether to show the figure with plt.show(). 
+            Defaults to True.
+        data : dict, optional
+            Data already returned by PlotData.sensitivity for 
+            the same keys and options. Defaults to None to 
+            prepare the data here.
+
+        Returns
+        -------
+        fig : matplotlib.figure.Figure
+            The figure of the plot.
 
         '''
         ylabel = 'Sensitivity'
         plot_lethargy = False
 
         # Send the data to the plot making function
-        self.__make_plot(keys, elow, ehigh, plot_err_bar, plot_fill_bet, plot_corr, plot_lethargy, legend_dict, r_pos, ylabel)
+        return self.__make_plot(keys, elow, ehigh, plot_err_bar, plot_fill_bet, plot_corr, plot_lethargy, legend_dict,
+                                r_pos, ylabel, save_as, show, data)
 
     def sensitivity_lethargy_plot(self, keys, elow=float('-inf'), ehigh=float('inf'), plot_err_bar=True,
-                                  plot_fill_bet=False, plot_corr=False, legend_dict=None, r_pos='bottom right'):
+                                  plot_fill_bet=False, plot_corr=False, legend_dict=None, r_pos='bottom right',
+                                  save_as=None, show=True, data=None):
         '''Plot the sensitivites per unit lethargy for the given isotopes, 
         reactions, unit numbers, and region numbers. Creates a matplotlib.pyplot 
         step plot for the energy bounds from the DataFrame.
@@ -443,17 +897,34 @@ class Plots():
             Where the correlation coefficient should go on the plot. 
             Defaults to 'bottom right'. Can also be 'top right', 
             'bottom left', and 'top left'.
+        save_as : str, optional
+            File to save the figure to. The format comes 
+            from the extension, e.g. '.png', '.pdf' or '.svg'.
+        show : bool, optional
+            Whether to show the figure with plt.show(). 
+            Defaults to True.
+        data : dict, optional
+            Data already returned by PlotData.sensitivity for 
+            the same keys and options. Defaults to None to 
+            prepare the data here.
+
+        Returns
+        -------
+        fig : matplotlib.figure.Figure
+            The figure of the plot.
 
         '''
         ylabel = 'Sensitivity per unit lethargy'
         plot_lethargy = True
 
         # Send the data to the plot making function
-        self.__make_plot(keys, elow, ehigh, plot_err_bar, plot_fill_bet, plot_corr, plot_lethargy, legend_dict, r_pos, ylabel)
+        return self.__make_plot(keys, elow, ehigh, plot_err_bar, plot_fill_bet, plot_corr, plot_lethargy, legend_dict,
+                                r_pos, ylabel, save_as, show, data)
 
     def heatmap_plot(self, mat_mt_1, mat_mt_2, filename, covariance=True, elow=float('-inf'),
                      ehigh=float('inf'), cmap='viridis', tick_step=1, mode='publication',
-                     label1=None, label2=None):
+                     label1=None, label2=None, save_as=None, show=True, max_pixels=None, reduce='mean',
+                     data=None):
         '''Create a heatmap of the covariance or 
         correlation matrix for the selected material 
         and reaction pairs.
@@ -494,64 +965,72 @@ class Plots():
             Desired text for the first nuclide and reaction.
         label2 : str, optional
             Desired text for the second nuclide and reaction.
+        save_as : str, optional
+            File to save the figure to. The format comes 
+            from the extension, e.g. '.png', '.pdf' or '.svg'.
+        show : bool, optional
+            Whether to show the figure with plt.show(). 
+            Defaults to True.
+        max_pixels : int or str, optional
+            Largest number of cells to draw along each side. 
+            Larger matrices are drawn with blocks of groups 
+            combined by reduce. 'auto' uses the size of the 
+            axes in pixels. Defaults to None to draw every group.
+        reduce : str, optional
+            How blocks of groups are combined. Either 'mean' 
+            or 'maxabs' for the value with the largest 
+            magnitude. Defaults to 'mean'.
+        data : dict, optional
+            Data already returned by PlotData.heatmap for 
+            the same pairs and options. Defaults to None to 
+            prepare the data here.
+
+        Returns
+        -------
+        fig : matplotlib.figure.Figure
+            The figure of the plot. The exact value under 
+            the cursor is shown with its coordinates.
         
         '''
-        # Figure out which nuclide and reaction should come first in the key
-        if tuple([mat_mt_1[0], mat_mt_1[1], mat_mt_2[0],  mat_mt_2[1]]) in self.cov_matrices[filename].keys():
-            mat_mt_pair = tuple([mat_mt_1[0], mat_mt_1[1], mat_mt_2[0],  mat_mt_2[1]])
-        elif tuple([mat_mt_2[0], mat_mt_2[1], mat_mt_1[0],  mat_mt_1[1]]) in self.cov_matrices[filename].keys():
-            mat_mt_pair = tuple([mat_mt_2[0], mat_mt_2[1], mat_mt_1[0],  mat_mt_1[1]])
-        else:
-            assert False, 'Material and Reaction pairs not found'
-
-        # Filter the boundaries for ehigh and elow
-        max_bounds_full = self.cov_groups[filename][:-1]
-        max_bounds = np.array([])
-        indices = []
-        for i in range(len(max_bounds_full)):
-            if max_bounds_full[i] <= ehigh and max_bounds_full[i] > elow:
-                max_bounds = np.append(max_bounds, max_bounds_full[i])
-                indices.append(i)
-        # Grab the indices of the maximum and minimum energy bound
-        i_max = indices[0]
-        i_min = indices[-1]+1
-
-        # Grab the matrix data
-        if covariance:
-            matrix_full = self.cov_matrices[filename][mat_mt_pair]
-            st = 'Covariance'
-
-        else:
-            # Calculate the correlation matrix
-            matrix_full = self.__cov_to_corr(mat_mt_pair, filename)
-            st = 'Correlation'
-        # Index the matrix data
-        matrix = matrix_full[i_max:i_min, i_max:i_min]
+        import matplotlib.pyplot as plt
+        # Window the matrix data unless it was prepared already
+        if data is None:
+            data = self.plot_data.heatmap(mat_mt_1, mat_mt_2, filename, covariance, elow, ehigh)
+        matrix = data['matrix']
+        max_bounds = data['max_bounds']
+        indices = data['groups']
+        st = data['kind']
 
         #Turn the matrix into a heatmap
         fig, ax = plt.subplots()
         fig.set_size_inches(13.25, 10)
-        im = ax.imshow(matrix, cmap=cmap, interpolation='none')
+        im, factor = self.__draw_matrix(ax, matrix, cmap, max_pixels, reduce)
+        # Read out the exact values when hovering
+        ax.format_coord = self.__matrix_coord(matrix, max_bounds, max_bounds)
         
         # Show the colorbar
         cbar = ax.figure.colorbar(im, ax=ax)
+        # No more ticks than there are cells drawn
+        tick_step = max(tick_step, factor)
+        ticks = np.arange(0, len(indices), tick_step)
         # Set the tick labels for either mode
         if mode == 'publication':
             # Make the labels show the max energy bounds
-            ax.set_xticks(np.arange(0, len(indices), tick_step))
-            ax.set_yticks(np.arange(0, len(indices), tick_step))
+            ax.set_xticks(ticks)
+            ax.set_yticks(ticks)
             # Make labels in scientific notation with 2 decimal places
-            labels = ['{:.2e}'.format(bound) for bound in max_bounds][::tick_step]
+            labels = np.char.mod('%.2e', max_bounds[ticks])
             ax.set_xticklabels(labels)
             ax.set_yticklabels(labels)
         elif mode == 'research':
             # Make the labels show the energy groups index
             # Preserves the x and y coordinates in top right corner
-            ax.set_xticks(np.arange(0, len(indices), tick_step))
-            ax.set_yticks(np.arange(0, len(indices), tick_step))
+            ax.set_xticks(ticks)
+            ax.set_yticks(ticks)
             # Put the max energy bounds on the right of the plot
             s1 = 'Max Bounds (eV)\n'
-            s2 = '\n'.join(['{}-{} : {:.2e}'.format(i-0.5, i+0.5, max_bounds[i]) for i in range(0,len(indices),tick_step)])
+            lines = np.char.add(np.char.mod('%s-', ticks - 0.5), np.char.mod('%s : ', ticks + 0.5))
+            s2 = '\n'.join(np.char.add(lines, np.char.mod('%.2e', max_bounds[ticks])))
             ax.text(float(-len(indices))/3.45, len(indices)/2, s1+s2, ha='left', va='center')
         else:
             assert False, "mode must be either 'research' or 'mode' not '{}'".format(mode)
@@ -579,49 +1058,122 @@ class Plots():
         # Make the layout tight and show the plot
         for _ in range(5):
             fig.tight_layout()
-        plt.show()
+        return self.__finish_figure(fig, save_as, show)
+
+    def block_heatmap_plot(self, filename, mats, mts=None, covariance=True, elow=float('-inf'), ehigh=float('inf'),
+                           cmap='viridis', max_pixels='auto', reduce='mean', save_as=None, show=True):
+        '''Create one heatmap of the block covariance or 
+        correlation matrix between every reaction of the 
+        given materials. See get_block_matrix.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the covariance file.
+        mats : int, str or list
+            Material id numbers or names.
+        mts : list of int, optional
+            Reactions to include in the given order. 
+            Defaults to every reaction of each material.
+        covariance : bool, optional
+            If true the covariance matrix is plotted. 
+            If false the correlation matrix is plotted.
+        elow : float, optional
+            The low bound for energies to plot. 
+            Defaults to -inf.
+        ehigh : float, optional
+            The high bound for energies to plot. 
+            Defaults to inf.
+        cmap : str, optional
+            Color mapping to be used for heatmap. 
+            Can be set as any Matplotlib cmap.
+        max_pixels : int or str, optional
+            Largest number of cells to draw along each side. 
+            See heatmap_plot. Defaults to 'auto' for the 
+            size of the axes in pixels.
+        reduce : str, optional
+            How blocks of groups are combined. Either 'mean' 
+            or 'maxabs'. Defaults to 'mean'.
+        save_as : str, optional
+            File to save the figure to. The format comes 
+            from the extension, e.g. '.png', '.pdf' or '.svg'.
+        show : bool, optional
+            Whether to show the figure with plt.show(). 
+            Defaults to True.
+
+        Returns
+        -------
+        fig : matplotlib.figure.Figure
+            The figure of the plot.
+
+        '''
+        import matplotlib.pyplot as plt
+        data = self.plot_data.block_heatmap(filename, mats, mts, covariance, elow, ehigh)
+        matrix = data['matrix']
+        mat_mts = data['mat_mts']
+        max_bounds = data['max_bounds']
+        st = data['kind']
+        num_groups = len(data['groups'])
+        assert len(mat_mts) > 0, 'No reactions found for {}'.format(mats)
+
+        # Readable name of each reaction
+        cov_index = self.cov_index[filename]
+        labels = ['{} {}'.format(cov_index['mat_names'][mat], cov_index['mt_names'][mt]) for mat, mt in mat_mts]
+
+        fig, ax = plt.subplots()
+        fig.set_size_inches(13.25, 10)
+        im, _ = self.__draw_matrix(ax, matrix, cmap, max_pixels, reduce)
+        cbar = ax.figure.colorbar(im, ax=ax)
+        cbar.set_label(st)
+
+        # Lines between the blocks of each reaction
+        edges = num_groups*np.arange(1, len(mat_mts)) - 0.5
+        ax.hlines(edges, -0.5, len(matrix)-0.5, colors='w', linewidth=0.5)
+        ax.vlines(edges, -0.5, len(matrix)-0.5, colors='w', linewidth=0.5)
+        # Label the center of each block with its reaction
+        centers = num_groups*np.arange(len(mat_mts)) + (num_groups-1)/2
+        ax.set_xticks(centers)
+        ax.set_yticks(centers)
+        ax.set_xticklabels(labels)
+        ax.set_yticklabels(labels)
+        ax.xaxis.tick_top()
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='left', rotation_mode='anchor')
+
+        # Read out the reactions, energies and exact value when hovering
+        block_labels = np.repeat(labels, num_groups)
+        block_bounds = np.tile(max_bounds, len(mat_mts))
+        def format_coord(x, y):
+            col, row = int(np.floor(x + 0.5)), int(np.floor(y + 0.5))
+            if 0 <= row < len(matrix) and 0 <= col < len(matrix):
+                return '{} {:.2e} eV, {} {:.2e} eV, value={:.4e}'.format(block_labels[col], block_bounds[col], block_labels[row],
+                                                                           block_bounds[row], matrix[row, col])
+            return 'x={:.1f}, y={:.1f}'.format(x, y)
+        ax.format_coord = format_coord
+
+        # Materials in the order they were given
+        names = dict.fromkeys(cov_index['mat_names'][mat] for mat, _ in mat_mts)
+        ax.set_title('{} matrix for {}'.format(st, ', '.join(names)))
+        fig.tight_layout()
+        return self.__finish_figure(fig, save_as, show)
 
     def __make_plot(self, keys, elow, ehigh, plot_err_bar, plot_fill_bet, plot_corr,
-                    plot_lethargy, legend_dict, r_pos, ylabel):
+                    plot_lethargy, legend_dict, r_pos, ylabel, save_as=None, show=True, data=None):
         '''The parts of making a plot that are repeated.'''
+        import matplotlib.pyplot as plt
         # Make sure keys is a list of lists
         if type(keys[0]) is not list:
             keys = [keys]
         # Assert maximum number of keys to plot
         assert len(keys) < 24, 'Maximum number of keys to plot is 24'
+        # Get the arrays to plot unless they were prepared already
+        if data is None:
+            data = self.plot_data.sensitivity(keys, elow, ehigh, lethargy=plot_lethargy, corr=plot_corr)
         # Create the title
-        exp_list = []
-        for exp, _, _, _ in keys:
-            exp_list.append(exp)
-        exp_set = set(exp_list)
-        title = '-'.join(exp_set)
+        title = '-'.join(set(key[0] for key in keys))
         # Create the text for the correlation
         r_text = ''
-        # The energy bounds information
-        indices_dict = {}
-        energy_vals_dict = {}
-        lethargies_dict = {}
-        for exp in exp_set:
-            indices_list = []
-            energy_vals_array = np.array([], dtype=float)
-            lethargies_array = np.array([], dtype=float)
-            for bound in self.df[exp].dropna().index:
-                # Add the high and low bounds to energy bounds
-                e_upper = float(bound.split(':')[0])
-                e_lower = float(bound.split(':')[1])
-                # Only add in energy values within given elow and ehigh
-                if e_upper <= ehigh and e_lower >= elow:
-                    indices_list.append(bound)
-                    energy_vals_array = np.append(energy_vals_array, [e_upper, e_lower])
-                    # Calculate the lethargies for each energy grouping
-                    lethargies_array = np.append(lethargies_array, log(e_upper/e_lower))
-            indices_dict[exp] = indices_list
-            energy_vals_dict[exp] = energy_vals_array
-            lethargies_dict[exp] = lethargies_array
         if plot_corr:
             r_text += 'Correlations:'
-            # Get the correlation coefficients
-            r_dict = self.get_corr(keys, elow=elow, ehigh=ehigh, lethargy=plot_lethargy)
             # Put the correlation coefficients into a string
             for i in range(len(keys)-1):
                 for j in range(i+1, len(keys)):
@@ -632,19 +1184,16 @@ class Plots():
                     else:
                         key_text1 = legend_dict[tuple(keys[i])]
                         key_text2 = legend_dict[tuple(keys[j])]
-                    # Get the correlation coefficients
-                    r = r_dict[(tuple(keys[i]),tuple(keys[j]))]
-                    r_text += '\n{} and {} r = {:.4}'.format(key_text1, key_text2, r)
-        i = 0
+                    r_text += '\n{} and {} r = {:.4}'.format(key_text1, key_text2, data['corr'][i, j])
         colors = ['g', 'r', 'c', 'm', 'k', 'y']
         ls = ['-', '--', '.-', '.']
         legends = []
         plt.figure()
-        for key in keys:
-            # Get the keys energy bound info
-            indices = indices_dict[key[0]]
-            energy_vals = energy_vals_dict[key[0]]
-            lethargies = lethargies_dict[key[0]]
+        for i, curve in enumerate(data['curves']):
+            key = curve['key']
+            energy_vals = curve['energy']
+            sens_step = curve['sens_step']
+            stdev_step = curve['std_step']
             # Create the legend title
             if legend_dict is None:
                 # If no legend was passed in create one
@@ -652,32 +1201,6 @@ class Plots():
             else:
                 # If legend titles were passed in then use them
                 legend_title = legend_dict[tuple(key)]
-            
-            # Raise an error if passed in keys are not 4
-            assert len(key) == 4, 'Must pass 4 identifiers in each key'
-
-            # Collect the the data for the key in given energy bounds and remove NaN
-            key_df = self.df[key[0]][key[1]][key[2]][key[3]].loc[indices].dropna()
-            sens = np.array(key_df['sensitivity'], dtype=float)
-            # Flag for stdev values existing
-            typeB = False
-            if len(key_df.columns) == 2:
-                stdevs = np.array(self.df[key[0]][key[1]][key[2]][key[3]]['std dev'].loc[indices].dropna(), dtype=float)
-                typeB = True
-
-            # Calculate the sensitivities per lethargy if passed in
-            if plot_lethargy:
-                sens = sens/lethargies
-                if typeB:
-                    stdevs = stdevs/lethargies
-
-            # Make each sensitivity std dev appear twice for step feature
-            sens_step = np.array([], dtype=float)
-            stdev_step = np.array([], dtype=float)
-            for j in range(len(sens)):
-                sens_step = np.append(sens_step, [sens[j], sens[j]])
-                if typeB:
-                    stdev_step = np.append(stdev_step, [stdevs[j], stdevs[j]])
 
             # Plot the sensitivity
             if not plot_fill_bet:
@@ -686,30 +1209,26 @@ class Plots():
                 plt.plot(energy_vals, sens_step, ls=ls[i//6], color=colors[i%6], linewidth=1, alpha=0)
 
             # If standard deviations exist
-            if typeB:
+            if stdev_step is not None:
                 if plot_err_bar:
                     assert plot_fill_bet is False, 'plot_err_bar and plot_fill_bet cannot both be True' 
                     # Plot the error bars
-                    mid_vals = np.power(10, (np.log10(energy_vals[::2]) + np.log10(energy_vals[1::2]))/2)
-                    _, _, eb = plt.errorbar(mid_vals, sens, yerr=stdevs, fmt='none', ecolor=colors[i%6], elinewidth=1, capsize=2, capthick=1)
+                    _, _, eb = plt.errorbar(curve['mid_energy'], curve['sens'], yerr=curve['std'], fmt='none',
+                                            ecolor=colors[i%6], elinewidth=1, capsize=2, capthick=1)
                     eb[0].set_linestyle(':')
                 elif plot_fill_bet:
                     # Plot the std dev as a fill between
                     plt.fill_between(energy_vals, sens_step-stdev_step, sens_step+stdev_step, ls=ls[i//6], color=colors[i%6], alpha=0.3)
 
             # Add the integral value information
-            int_value, int_unc = self.get_integral(key)
-            if not typeB:
+            if stdev_step is None:
                 # If there is no integral std dev
-                legend_title += '\nIntegral Value = {:.4}'.format(int_value)
+                legend_title += '\nIntegral Value = {:.4}'.format(curve['integral'])
             else:
                 # If there is an integral std dev
-                legend_title += '\nIntegral Value = {:.4} \u00B1 {:.4}'.format(int_value, int_unc)
+                legend_title += '\nIntegral Value = {:.4} \u00B1 {:.4}'.format(curve['integral'], curve['integral_unc'])
 
             legends.append(legend_title)
-
-            # Increment color variable
-            i += 1
         # Put the correlation coefficients on the plot
         ax = plt.gca()
         if r_pos.lower() == 'top right':
@@ -724,45 +1243,228 @@ class Plots():
         # Final plot settings
         legend = plt.legend(legends)
         # Make the legend markers opaque
-        for l in legend.legendHandles:
+        for l in legend.legend_handles:
             l.set_alpha(1)
         plt.xscale('log')
         plt.xlabel('Energy (eV)')
         plt.ylabel(ylabel)
         plt.title(title)
-        plt.grid(b=True)
+        plt.grid(visible=True)
         plt.tight_layout()
-        plt.show()
+        return self.__finish_figure(plt.gcf(), save_as, show)
+
+    def __draw_matrix(self, ax, matrix, cmap, max_pixels, reduce):
+        # Draw a matrix in element coordinates combining blocks past max_pixels
+        if max_pixels == 'auto':
+            bbox = ax.get_window_extent()
+            max_pixels = int(max(bbox.width, bbox.height))
+        if max_pixels is None:
+            return ax.imshow(matrix, cmap=cmap, interpolation='none'), 1
+        reduced, factor = block_reduce(matrix, max_pixels, reduce)
+        # Stretch each block over the elements it covers
+        height, width = factor * np.array(reduced.shape)
+        im = ax.imshow(reduced, cmap=cmap, interpolation='none', extent=(-0.5, width-0.5, height-0.5, -0.5))
+        # Partial blocks on the edges stay inside the matrix
+        ax.set_xlim(-0.5, matrix.shape[1]-0.5)
+        ax.set_ylim(matrix.shape[0]-0.5, -0.5)
+        return im, factor
+
+    def __matrix_coord(self, matrix, row_bounds, col_bounds):
+        # Cursor text with the exact value of the element under it
+        def format_coord(x, y):
+            col, row = int(np.floor(x + 0.5)), int(np.floor(y + 0.5))
+            if 0 <= row < matrix.shape[0] and 0 <= col < matrix.shape[1]:
+                return 'x={} ({:.2e} eV), y={} ({:.2e} eV), value={:.4e}'.format(col, col_bounds[col], row, row_bounds[row], matrix[row, col])
+            return 'x={:.1f}, y={:.1f}'.format(x, y)
+        return format_coord
+
+    def __finish_figure(self, fig, save_as, show):
+        # Save and or show a finished figure
+        import matplotlib.pyplot as plt
+        if save_as is not None:
+            fig.savefig(save_as)
+        if show:
+            plt.show()
+        return fig
+
+    def __sdf_frame(self, sdf_data):
+        import pandas as pd
+        # Index each energy group by its lower and upper bound
+        groups = sdf_data['groups']
+        energy_bounds = self.__group_index(groups)
+        # Interleave the value arrays so each profile's columns are together
+        keys = sdf_data['keys']
+        values = sdf_data['values']
+        names = list(values.keys())
+        data = np.empty((len(energy_bounds), len(keys)*len(names)), dtype=float)
+        for i, name in enumerate(names):
+            data[:, i::len(names)] = values[name].T
+        # Name the idices and columns
+        if sdf_data['type_a']:
+            column_names = ['experiment', 'isotope', 'reaction', '(unit, region)', '']
+        else:
+            column_names = ['experiment', 'isotope', 'reaction', 'region', '']
+        columns = pd.MultiIndex.from_tuples([(sdf_data['experiment'],) + key + (name,) for key in keys for name in names],
+                                            names=column_names)
+        df = pd.DataFrame(data, index=energy_bounds, columns=columns)
+        df.index.name = 'energy bounds (ev)'
+        return df
+
+    def __integral_frame(self, sdf_data):
+        # Integral of every profile of a parsed file
+        import pandas as pd
+        values = sdf_data['values']
+        integral = values['sensitivity'].sum(axis=1)
+        if 'std dev' in values:
+            # Root sum square of the standard deviations
+            uncertainty = np.sqrt(np.square(values['std dev']).sum(axis=1))
+        else:
+            uncertainty = np.full(len(integral), np.nan)
+        index = pd.MultiIndex.from_tuples([(sdf_data['experiment'],) + key for key in sdf_data['keys']],
+                                          names=['experiment', 'isotope', 'reaction', 'region'])
+        return pd.DataFrame({'integral': integral, 'uncertainty': uncertainty}, index=index)
+
+    def __df_integral_frame(self, df):
+        # Same as __integral_frame from the columns of a DataFrame
+        import pandas as pd
+        sens = df.xs('sensitivity', axis=1, level=-1)
+        integral = sens.sum()
+        if 'std dev' in df.columns.get_level_values(-1):
+            uncertainty = np.sqrt(np.square(df.xs('std dev', axis=1, level=-1)).sum()).reindex(sens.columns)
+        else:
+            uncertainty = pd.Series(np.nan, index=sens.columns)
+        frame = pd.DataFrame({'integral': integral.values, 'uncertainty': uncertainty.values},
+                             index=sens.columns)
+        frame.index.names = ['experiment', 'isotope', 'reaction', 'region']
+        return frame
+
+    def __update_query_blocks(self):
+        # Running sums and key arrays of the files loaded since the last query
+        for sdf_data in self.sdf_blocks[len(self._query_blocks):]:
+            sens = sdf_data['values']['sensitivity']
+            cumsum = np.zeros((len(sens), sens.shape[1]+1))
+            np.cumsum(sens, axis=1, out=cumsum[:, 1:])
+            keys = np.array(sdf_data['keys'], dtype=str).reshape(-1, 3)
+            self._query_blocks.append({'cumsum': cumsum, 'keys': keys})
+
+    def __select(self, values, selection):
+        # Mask of the values matching a filter like the ones in sdf_to_df
+        if selection is None:
+            return np.ones(len(values), dtype=bool)
+        # Check each distinct value once
+        unique, inverse = np.unique(values, return_inverse=True)
+        if callable(selection):
+            matches = np.array([bool(selection(value)) for value in unique.tolist()], dtype=bool)
+        elif isinstance(selection, str):
+            matches = unique == selection
+        else:
+            matches = np.isin(unique, list(selection))
+        return matches[inverse.ravel()]
 
     def __get_energy_bounds(self, elow, ehigh):
         # Collect the energy bounds (x-axis)
-        indices = []
-        energy_vals = np.array([], dtype=float)
-        lethargies = np.array([], dtype=float)
-        for bound in self.df.index:
-            # Add the high and low bounds to energy bounds
-            e_upper = float(bound.split(':')[0])
-            e_lower = float(bound.split(':')[1])
-            # Only add in energy values within given elow and ehigh
-            if e_upper <= ehigh and e_lower >= elow:
-                indices.append(bound)
-                energy_vals = np.append(energy_vals, [e_upper, e_lower])
-                # Calculate the lethargies for each energy grouping
-                lethargies = np.append(lethargies, log(e_upper/e_lower))
+        e_upper = np.asarray(self.df.index.right, dtype=float)
+        e_lower = np.asarray(self.df.index.left, dtype=float)
+        # Only keep energy values within given elow and ehigh
+        in_bounds = (e_upper <= ehigh) & (e_lower >= elow)
+        indices = self.df.index[in_bounds]
+        energy_vals = np.column_stack([e_upper[in_bounds], e_lower[in_bounds]]).ravel()
+        # Calculate the lethargies for each energy grouping
+        lethargies = np.log(e_upper[in_bounds] / e_lower[in_bounds])
         return indices, energy_vals, lethargies
 
+    def __group_index(self, groups):
+        # DataFrame index for a group structure
+        import pandas as pd
+        return pd.IntervalIndex.from_arrays(groups.lower, groups.upper, closed='left')
+
+    def __sdf_block(self, experiment):
+        # Latest parsed file of an experiment
+        for sdf_data in reversed(self.sdf_blocks):
+            if sdf_data['experiment'] == experiment:
+                return sdf_data
+        raise KeyError('Experiment {} has not been loaded.'.format(experiment))
+
+    def __cov_profiles(self, sdf_data, cov_file, region, exclude_mts):
+        # Row of the profile of each (za, mt) to use with a covariance file
+        groups = sdf_data['groups']
+        cov_groups = self.cov_groups[cov_file]
+        if len(cov_groups) != len(groups.bounds) or not np.allclose(cov_groups, groups.bounds, rtol=1e-4):
+            raise ValueError('{} and {} do not have the same energy groups.'.format(sdf_data['experiment'], cov_file))
+        if region is None:
+            region = '(0,0)' if sdf_data['type_b'] else '0'
+        rows = {}
+        for i, (key, mat_mt) in enumerate(zip(sdf_data['keys'], sdf_data['ids'].tolist())):
+            if key[2] == region and mat_mt[1] not in exclude_mts:
+                rows.setdefault(tuple(mat_mt), i)
+        return rows
+
+    def __cov_pairs(self, cov_file, mat_mts):
+        # Keys of the matrices between two of the (mat, mt)
+        cov_index = self.cov_index[cov_file]
+        pairs = set()
+        for mat_mt in mat_mts:
+            for partner in cov_index['partners'].get(mat_mt, ()):
+                if partner in mat_mts:
+                    pairs.add(cov_index['pairs'][mat_mt + partner])
+        return sorted(pairs)
+
+    def __is_banded(self, cov_file, pairs):
+        # Whether the matrices of a file are stored as BandedMatrix objects
+        return len(pairs) > 0 and isinstance(self.cov_matrices[cov_file][pairs[0]], BandedMatrix)
+
+    def __cov_index(self, keys):
+        # Lookups for the matrices of a covariance file
+        pairs = {}
+        partners = {}
+        for mat1, mt1, mat2, mt2 in keys:
+            pairs[(mat1, mt1, mat2, mt2)] = (mat1, mt1, mat2, mt2)
+            partners.setdefault((mat1, mt1), set()).add((mat2, mt2))
+            partners.setdefault((mat2, mt2), set()).add((mat1, mt1))
+        # Stored keys take priority over the reversed keys
+        for mat1, mt1, mat2, mt2 in keys:
+            pairs.setdefault((mat2, mt2, mat1, mt1), (mat1, mt1, mat2, mt2))
+        # Reactions of each material
+        reactions = {}
+        for mat, mt in partners:
+            reactions.setdefault(mat, set()).add(mt)
+        # Translate each id once
+        mat_names = {mat: self.__id_name(self.get_mat_name, mat) for mat in reactions}
+        mt_names = {mt: self.__id_name(self.get_mt_name, mt) for _, mt in partners}
+        return {'pairs': pairs, 'partners': partners, 'reactions': reactions,
+                'mat_names': mat_names, 'mat_ids': {name: mat for mat, name in mat_names.items()},
+                'mt_names': mt_names, 'mt_ids': {name: mt for mt, name in mt_names.items()}}
+
+    def __id_name(self, get_name, id_num):
+        # Files may have ids missing from scale_ids.py
+        try:
+            return get_name(id_num)
+        except KeyError:
+            return str(id_num)
+
     def __cov_to_corr(self, mat_mt_pair, filename):
+        # Reuse the correlation matrix if it was already calculated
+        if (filename, mat_mt_pair) in self._corr_matrices:
+            # Mark the matrix as the most recently used
+            self._corr_matrices.move_to_end((filename, mat_mt_pair))
+            return self._corr_matrices[(filename, mat_mt_pair)]
         # Grab the covariance matrix
         cov_mat = self.cov_matrices[filename][mat_mt_pair]
-        num_groups = len(cov_mat)
-        mat_mt1 = (mat_mt_pair[0], mat_mt_pair[1])
-        mat_mt2 = (mat_mt_pair[2], mat_mt_pair[3])
-        # Initialize correlation matrix
-        corr = np.zeros((num_groups, num_groups))
-        for i in range(num_groups):
-            for j in range(num_groups):
-                # corr[i][j] = cov[i][j] / (xs_error[i] * xs_error[j])
-                std1 = self.mat_xs[filename][mat_mt1]['std'][i]
-                std2 = self.mat_xs[filename][mat_mt2]['std'][j]
-                corr[i][j] =  cov_mat[i][j] / (std1 * std2)
+        # corr[i][j] = cov[i][j] / (xs_error[i] * xs_error[j])
+        std1 = self.mat_xs[filename][(mat_mt_pair[0], mat_mt_pair[1])]['std']
+        std2 = self.mat_xs[filename][(mat_mt_pair[2], mat_mt_pair[3])]['std']
+        if isinstance(cov_mat, BandedMatrix):
+            # Scale the band without making it dense
+            corr = cov_mat.scale(self.__safe_inverse(std1), self.__safe_inverse(std2))
+        else:
+            # Groups without an error have no correlation
+            std_outer = np.outer(std1, std2)
+            corr = np.divide(cov_mat, std_outer, out=np.zeros(std_outer.shape), where=std_outer != 0)
+        self._corr_matrices[(filename, mat_mt_pair)] = corr
+        if len(self._corr_matrices) > self._max_corr_cached:
+            self._corr_matrices.popitem(last=False)
         return corr
+
+    def __safe_inverse(self, values):
+        # 1/values with zero where values is zero
+        return np.divide(1, values, out=np.zeros(len(values)), where=values != 0)
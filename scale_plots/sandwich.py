@@ -0,0 +1,85 @@
+import numpy as np
+
+# Each process keeps the arrays sent by init_worker so they are only pickled once
+_sens = None
+_first = None
+_second = None
+_matrices = None
+
+
+def sandwich_matrix(left, right, first, second, matrices, block=256):
+    '''Sandwich rule between every row of left and right.
+    Returns S_a C S_b^T for every sensitivity set a in left
+    and b in right where C is the full covariance made of
+    the matrices between reactions.
+
+    Parameters
+    ----------
+    left : numpy.ndarray
+        (n, num reactions, num groups) sensitivities.
+    right : numpy.ndarray
+        (m, num reactions, num groups) sensitivities.
+    first : numpy.ndarray
+        Reaction of the rows of each matrix.
+    second : numpy.ndarray
+        Reaction of the columns of each matrix.
+    matrices : numpy.ndarray or list of BandedMatrix
+        (num matrices, num groups, num groups) covariance
+        matrices. Matrices between two different reactions
+        are also used transposed for the reversed pair.
+        scale_plots.banded.BandedMatrix objects are
+        multiplied on their band.
+    block : int, optional
+        Number of matrices multiplied at once.
+
+    Returns
+    -------
+    product : numpy.ndarray
+        (n, m) array of the sandwich products.
+
+    '''
+    if not isinstance(matrices, np.ndarray):
+        return _sandwich_banded(left, right, first, second, matrices)
+    # The transpose of each matrix covers the reversed pair
+    reverse = np.flatnonzero(first != second)
+    rows = np.concatenate([first, second[reverse]])
+    cols = np.concatenate([second, first[reverse]])
+
+    product = np.zeros((len(left), len(right)))
+    num_matrices = len(matrices)
+    for start in range(0, len(rows), block):
+        index = np.arange(start, min(start+block, len(rows)))
+        # Matrices past the stored ones are the transposes
+        stored = index < num_matrices
+        chunk = np.empty((len(index),) + matrices.shape[1:])
+        chunk[stored] = matrices[index[stored]]
+        chunk[~stored] = matrices[reverse[index[~stored] - num_matrices]].transpose(0, 2, 1)
+        # S_a C for every matrix at once then sum the products with S_b
+        left_terms = np.matmul(left[:, rows[index]].transpose(1, 0, 2), chunk)
+        product += np.tensordot(left_terms.transpose(1, 0, 2), right[:, cols[index]], axes=([1, 2], [1, 2]))
+    return product
+
+
+def _sandwich_banded(left, right, first, second, matrices):
+    # Sum S_a C into the reaction of the columns of each matrix then multiply by S_b once
+    terms = np.zeros((len(left),) + right.shape[1:])
+    for i, j, matrix in zip(first, second, matrices):
+        terms[:, j] += left[:, i] @ matrix
+        if i != j:
+            # S_a C^T for the reversed pair is (C S_a^T)^T
+            terms[:, i] += (matrix @ left[:, j].T).T
+    return np.tensordot(terms, right, axes=([1, 2], [1, 2]))
+
+
+def init_worker(sens, first, second, matrices):
+    # Keep the arrays every block of rows is multiplied with
+    global _sens, _first, _second, _matrices
+    _sens = sens
+    _first = first
+    _second = second
+    _matrices = matrices
+
+
+def sandwich_rows(rows):
+    # sandwich_matrix for a block of rows of the arrays from init_worker
+    return sandwich_matrix(_sens[rows], _sens, _first, _second, _matrices)
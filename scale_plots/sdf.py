@@ -0,0 +1,448 @@
+import json
+import mmap
+import os
+import numpy as np
+from math import ceil
+
+from .groups import GroupStructure
+
+# Exactly representable powers of ten for decoding fixed width values
+_POWERS_OF_TEN = np.array([float('1e{}'.format(i)) for i in range(23)])
+
+
+class SdfFile():
+    '''Memory-mapped reader for a keno sdf file.
+    Profiles are decoded one at a time so the
+    whole file never has to be held in memory.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the sdf file to read.
+
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.experiment = filename[:-4].split('/')[-1]
+        self._file = open(filename, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._read_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''Release the memory map and the file handle.'''
+        self._mm.close()
+        self._file.close()
+
+    def _read_header(self):
+        mm = self._mm
+        mm.seek(0)
+        header = [mm.readline() for _ in range(5)]
+        # Read in the header data
+        self.num_neutron_groups = int(header[1].split()[0])
+        self.num_sens_profiles = int(header[2].split()[0])
+
+        # Collect the engergy boundaries
+        lines_energy_bound = ceil((self.num_neutron_groups+1) / 5)
+        bounds = b''.join([mm.readline() for _ in range(lines_energy_bound)]).split()
+        self.groups = GroupStructure(np.array(bounds[:self.num_neutron_groups+1], dtype=float))
+        # Number of lines each profile has of sensitivity values
+        self.lines_values = ceil(self.num_neutron_groups/5)
+
+        # Byte offset of the first sensitivity profile
+        self.profiles_start = mm.tell()
+        # Number of lines each sensitivity profile takes
+        num_keys = len(mm.readline().split())
+        self.type_a = num_keys == 6
+        self.type_b = num_keys == 4
+        if self.type_a:
+            self.lines_profile = self.lines_values + 2
+            # Line of each profile its value blocks start on
+            self._value_starts = {'sensitivity': 2}
+        elif self.type_b:
+            self.lines_profile = 2 * self.lines_values + 4
+            # Type A has no stdev so it is only read here
+            self._value_starts = {'std dev': 4 + self.lines_values, 'sensitivity': 4}
+        else:
+            raise ValueError('{} is not a type A or type B sdf file.'.format(self.filename))
+
+    def profiles(self, nuclides=None, reactions=None, regions=None):
+        '''Generator over the sensitivity profiles of the file.
+        Profiles that do not match the filters are skipped
+        without decoding their values.
+
+        Parameters
+        ----------
+        nuclides : set or callable, optional
+            Nuclide names to keep, or a function that takes 
+            a nuclide name and returns True to keep it. 
+            Defaults to every nuclide.
+        reactions : set or callable, optional
+            Same as nuclides but for the reaction names.
+        regions : set or callable, optional
+            Same as nuclides but for the unit and region.
+
+        Yields
+        ------
+        key : tuple
+            (nuclide, reaction, unit_region) identifying the profile.
+        values : dict
+            'sensitivity' and, for type B files, 'std dev'
+            numpy arrays with one value per energy group.
+
+        '''
+        mm = self._mm
+        mm.seek(self.profiles_start)
+        for _ in range(self.num_sens_profiles):
+            lines = [mm.readline(), mm.readline()]
+            key, _ = self._profile_key(*lines)
+            if not _selected(key, nuclides, reactions, regions):
+                # Skip past the values of this profile
+                for _ in range(self.lines_profile - 2):
+                    mm.readline()
+                continue
+            lines += [mm.readline() for _ in range(self.lines_profile - 2)]
+            yield key, self._profile_values(lines)
+
+    def read_profiles(self, nuclides=None, reactions=None, regions=None):
+        '''Decode every sensitivity profile of the file in bulk.
+        All of the value blocks are decoded by a single numpy
+        call and reshaped into one row per profile. Profiles 
+        that do not match the filters are never decoded. See 
+        SdfFile.profiles for the filters.
+
+        Returns
+        -------
+        keys : list of tuples
+            (nuclide, reaction, unit_region) for each profile.
+        values : dict
+            'sensitivity' and, for type B files, 'std dev'
+            numpy arrays of shape (num profiles, num groups).
+
+        '''
+        keys, _, values = self._read_profiles(nuclides, reactions, regions)
+        return keys, values
+
+    def _read_profiles(self, nuclides=None, reactions=None, regions=None):
+        # read_profiles that also returns the (za, mt) ids of each profile
+        mm = self._mm
+        num_profiles = self.num_sens_profiles
+        line_starts = _line_starts(mm, self.profiles_start)
+        if len(line_starts) <= num_profiles * self.lines_profile:
+            raise ValueError('{} ended before all of its profiles were read.'.format(self.filename))
+
+        # Read only the header lines of each profile using the profile stride
+        keys = []
+        ids = []
+        key_lines = []
+        for line in range(0, num_profiles * self.lines_profile, self.lines_profile):
+            key, profile_ids = self._profile_key(mm[line_starts[line]:line_starts[line+1]],
+                                                 mm[line_starts[line+1]:line_starts[line+2]])
+            if _selected(key, nuclides, reactions, regions):
+                keys.append(key)
+                ids.append(profile_ids)
+                key_lines.append(line)
+        key_lines = np.array(key_lines, dtype=int)
+        ids = np.array(ids, dtype=int).reshape(-1, 2)
+
+        values = {name: self._decode_blocks(line_starts, key_lines + start)
+                  for name, start in self._value_starts.items()}
+        return keys, ids, values
+
+    def profile_offsets(self):
+        '''Scan the header line of every profile and record 
+        where each profile is stored in the file.
+
+        Returns
+        -------
+        offsets : dict
+            key : (nuclide, reaction, unit_region) of the profile 
+            value : (byte offset, length in bytes) of the profile
+
+        '''
+        mm = self._mm
+        num_profiles = self.num_sens_profiles
+        line_starts = _line_starts(mm, self.profiles_start)
+        if len(line_starts) <= num_profiles * self.lines_profile:
+            raise ValueError('{} ended before all of its profiles were read.'.format(self.filename))
+        key_lines = np.arange(num_profiles) * self.lines_profile
+        starts = line_starts[key_lines]
+        ends = line_starts[key_lines + self.lines_profile]
+        offsets = {}
+        for line, start, end in zip(key_lines, starts, ends):
+            key, _ = self._profile_key(mm[start:line_starts[line+1]], mm[line_starts[line+1]:line_starts[line+2]])
+            offsets[key] = (int(start), int(end - start))
+        return offsets
+
+    def read_profile_at(self, offset, length):
+        '''Decode the single profile stored at a byte 
+        offset found with SdfFile.profile_offsets.
+
+        Returns
+        -------
+        values : dict
+            'sensitivity' and, for type B files, 'std dev'
+            numpy arrays with one value per energy group.
+
+        '''
+        lines = self._mm[offset:offset+length].splitlines(keepends=True)
+        if len(lines) != self.lines_profile:
+            raise ValueError('No profile is stored at byte {} of {}.'.format(offset, self.filename))
+        return self._profile_values(lines)
+
+    def _profile_key(self, key_line, second_line):
+        # Identifying keys and (za, mt) ids of a profile from its first two lines
+        if not second_line:
+            raise ValueError('{} ended before all of its profiles were read.'.format(self.filename))
+        key = key_line.split()
+        if self.type_a:
+            unit_region = key[4].decode()
+        else:
+            unit_num, region_num = second_line.split()[:2]
+            unit_region = '({},{})'.format(unit_num.decode(), region_num.decode())
+        # Nuclide za and reaction mt numbers follow the names
+        ids = [int(num) for num in key[2:4]]
+        return (key[0].decode(), key[1].decode(), unit_region), ids
+
+    def _profile_values(self, lines):
+        # Decode the value blocks of one profile from all of its lines
+        values = {name: _decode(lines[start:start+self.lines_values])
+                  for name, start in self._value_starts.items()}
+        # A file that ends early gives short or missing value lines
+        if any(value.size != self.num_neutron_groups for value in values.values()):
+            raise ValueError('{} has a malformed sensitivity block.'.format(self.filename))
+        return values
+
+    def _decode_blocks(self, line_starts, first_lines):
+        # Join the value block of every profile and decode them at once
+        mm = self._mm
+        starts = line_starts[first_lines]
+        ends = line_starts[first_lines + self.lines_values]
+        text = b''.join([mm[start:end] for start, end in zip(starts, ends)])
+        values = _decode_fixed(text)
+        if values is None:
+            # Not laid out in fixed width fields so parse the text
+            values = np.fromstring(text, sep=' ')
+        if values.size != len(first_lines) * self.num_neutron_groups:
+            raise ValueError('{} has a malformed sensitivity block.'.format(self.filename))
+        return values.reshape(len(first_lines), self.num_neutron_groups)
+
+
+def read_sdf(filename, nuclides=None, reactions=None, regions=None):
+    '''Parse a whole sdf file into plain python and numpy
+    objects that can be sent between processes. Only the
+    profiles matching the filters are decoded, see
+    SdfFile.profiles for the filters.
+
+    Returns
+    -------
+    sdf_data : dict
+        'experiment', 'type_a', 'type_b', 'groups' (the
+        GroupStructure of the file), 'keys' and 'values'
+        as returned by SdfFile.read_profiles and 'ids'
+        the (num profiles, 2) array of the za and mt
+        numbers of each profile.
+
+    '''
+    with SdfFile(filename) as sdf:
+        keys, ids, values = sdf._read_profiles(nuclides, reactions, regions)
+        return {'experiment': sdf.experiment, 'type_a': sdf.type_a, 'type_b': sdf.type_b,
+                'groups': sdf.groups, 'keys': keys, 'ids': ids, 'values': values}
+
+
+def iter_sdf(filename, nuclides=None, reactions=None, regions=None):
+    '''Yield every sensitivity profile in an sdf file
+    without reading the whole file into memory.
+    See SdfFile.profiles for the filters and yielded values.
+    '''
+    with SdfFile(filename) as sdf:
+        yield from sdf.profiles(nuclides, reactions, regions)
+
+
+def profile_index(filename, persist=True):
+    '''Return the byte offset and length of every profile 
+    in an sdf file. The index is saved next to the file as 
+    filename + '.idx' and reused until the file changes.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the sdf file.
+    persist : bool, optional
+        Whether to read and write the index file. 
+        Defaults to True.
+
+    Returns
+    -------
+    offsets : dict
+        key : (nuclide, reaction, unit_region) of the profile 
+        value : (byte offset, length in bytes) of the profile
+
+    '''
+    stat = os.stat(filename)
+    index_file = filename + '.idx'
+    if persist and os.path.exists(index_file):
+        try:
+            with open(index_file, 'r') as file:
+                saved = json.load(file)
+            # Only reuse the index if the sdf file has not changed
+            if saved['size'] == stat.st_size and saved['mtime'] == stat.st_mtime_ns:
+                return {tuple(entry[:3]): (entry[3], entry[4]) for entry in saved['profiles']}
+        except (OSError, ValueError, KeyError, IndexError):
+            pass
+
+    with SdfFile(filename) as sdf:
+        offsets = sdf.profile_offsets()
+    if persist:
+        saved = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                 'profiles': [list(key) + list(value) for key, value in offsets.items()]}
+        try:
+            with open(index_file, 'w') as file:
+                json.dump(saved, file)
+        except OSError:
+            # The index is only an optimization so carry on without it
+            pass
+    return offsets
+
+
+def read_profile(filename, key, offsets=None):
+    '''Decode a single profile of an sdf file by seeking 
+    straight to it with the profile index.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the sdf file.
+    key : tuple
+        (nuclide, reaction, unit_region) of the profile.
+    offsets : dict, optional
+        Index from profile_index. Loaded or built if not given.
+
+    Returns
+    -------
+    groups : scale_plots.groups.GroupStructure
+        Energy groups of the file.
+    values : dict
+        'sensitivity' and, for type B files, 'std dev'
+        numpy arrays with one value per energy group.
+
+    '''
+    if offsets is None:
+        offsets = profile_index(filename)
+    key = tuple(key)
+    if key not in offsets:
+        raise KeyError('{} is not a profile in {}.'.format(key, filename))
+    with SdfFile(filename) as sdf:
+        return sdf.groups, sdf.read_profile_at(*offsets[key])
+
+
+def _selected(key, nuclides, reactions, regions):
+    # Check a profile key against the nuclide, reaction and region filters
+    for value, selection in zip(key, (nuclides, reactions, regions)):
+        if selection is None:
+            continue
+        if callable(selection):
+            if not selection(value):
+                return False
+        elif isinstance(selection, str):
+            if value != selection:
+                return False
+        elif value not in selection:
+            return False
+    return True
+
+
+def _line_starts(mm, start, chunk=1 << 26):
+    # Byte offsets of every line from start to the end of the file
+    starts = [np.array([start])]
+    for pos in range(start, len(mm), chunk):
+        buf = np.frombuffer(mm, dtype=np.uint8, count=min(chunk, len(mm)-pos), offset=pos)
+        starts.append(np.flatnonzero(buf == ord('\n')) + pos + 1)
+        del buf
+    # Treat the end of the file as the start of a line if it has no newline
+    if len(mm) > start and mm[len(mm)-1:] != b'\n':
+        starts.append(np.array([len(mm)]))
+    return np.concatenate(starts)
+
+
+def _decode_fixed(text, per_line=5):
+    '''Decode Fortran E formatted values (e.g. 1p5e14.6) by column
+    arithmetic on the raw bytes. The layout of the fields comes from
+    the first value and every field is checked against it, so None
+    is returned for anything else and the caller can fall back to a
+    text parser. The results are the same as a decimal to float parse.
+    '''
+    line_len = text.find(b'\n')
+    if line_len <= 0 or line_len % per_line != 0:
+        return None
+    width = line_len // per_line
+    text = text.replace(b'\n', b'')
+    if len(text) % width != 0:
+        return None
+    # Columns of the decimal point, the exponent and the first digit
+    first = text[:width]
+    dot = first.find(b'.')
+    exp = max(first.find(b'E'), first.find(b'e'))
+    lead = dot
+    while lead > 0 and first[lead-1:lead].isdigit():
+        lead -= 1
+    # Mantissas must also fit exactly in a float
+    if lead == dot or exp <= dot + 1 or exp + 2 >= width or exp - lead - 1 > 15:
+        return None
+
+    # One contiguous row per column of the fields
+    columns = np.frombuffer(text, dtype=np.uint8).reshape(-1, width).T.copy()
+    digits = columns - np.uint8(ord('0'))
+    exp_sign = columns[exp+1]
+    if not ((columns[dot] == ord('.')).all() and ((columns[exp] | 0x20) == ord('e')).all()
+            and ((exp_sign == ord('+')) | (exp_sign == ord('-'))).all()
+            and (digits[lead:dot] <= 9).all() and (digits[dot+1:exp] <= 9).all() and (digits[exp+2:] <= 9).all()):
+        return None
+    if lead > 0:
+        # Only blanks and then an optional sign may come before the digits
+        sign = columns[lead-1]
+        if not ((columns[:lead-1] == ord(' ')).all()
+                and ((sign == ord(' ')) | (sign == ord('+')) | (sign == ord('-'))).all()):
+            return None
+
+    # Build the integer mantissa and exponent one column at a time
+    mantissa = digits[lead].astype(np.int32 if exp - lead - 1 <= 9 else np.int64)
+    for col in range(lead+1, exp):
+        if col != dot:
+            mantissa *= 10
+            mantissa += digits[col]
+    power = digits[exp+2].astype(np.intp)
+    for col in range(exp+3, width):
+        power *= 10
+        power += digits[col]
+    power *= 1 - 2*(exp_sign == ord('-'))
+    power -= exp - dot - 1
+
+    # Powers of ten up to 1e22 are exact so one multiply or divide rounds correctly
+    index = np.abs(power)
+    inexact = np.flatnonzero(index > 22) if index.max() > 22 else []
+    if len(inexact) > len(power) // 100:
+        return None
+    index[inexact] = 0
+    mantissa = mantissa.astype(float)
+    values = mantissa / _POWERS_OF_TEN[index]
+    positive = np.flatnonzero(power > 0)
+    values[positive] = mantissa[positive] * _POWERS_OF_TEN[index[positive]]
+    if lead > 0:
+        # Multiplying by -1 also keeps the sign of -0.0
+        values *= 1.0 - 2.0*(sign == ord('-'))
+    # The few values outside of that range are parsed on their own
+    for i in inexact:
+        values[i] = float(text[i*width:(i+1)*width])
+    return values
+
+
+def _decode(lines):
+    # Turn lines of whitespace separated values into a float array
+    return np.array(b''.join(lines).split(), dtype=float)
@@ -1,9 +1,52 @@
 import PyQt5
 import matplotlib.pyplot as plt
+import numpy as np
 import sys
 import os
+import threading
+from functools import partial
 
 import scale_plots
+from scale_plots.cache import cached_read_sdf, cached_read_coverx
+
+
+class WorkerSignals(PyQt5.QtCore.QObject):
+    '''Signals sent by a Worker. Slots connected in the 
+    main thread are run in the main thread.'''
+    progress = PyQt5.QtCore.pyqtSignal(str)
+    result = PyQt5.QtCore.pyqtSignal(object)
+    error = PyQt5.QtCore.pyqtSignal(str)
+    finished = PyQt5.QtCore.pyqtSignal()
+
+
+class Worker(PyQt5.QtCore.QRunnable):
+    '''Runs a function in a QThreadPool thread and sends 
+    its result back with signals. Cancelled workers that 
+    have not started are skipped and the results of 
+    running ones are thrown away.'''
+
+    def __init__(self, description, function, *args):
+        PyQt5.QtCore.QRunnable.__init__(self)
+        self.description = description
+        self.function = function
+        self.args = args
+        self.signals = WorkerSignals()
+        self.cancelled = False
+        # The GUI holds on to the worker until it has finished
+        self.setAutoDelete(False)
+
+    def run(self):
+        if not self.cancelled:
+            self.signals.progress.emit(self.description)
+            try:
+                result = self.function(*self.args)
+            except Exception as err:
+                if not self.cancelled:
+                    self.signals.error.emit('{} failed. {}: {}'.format(self.description, type(err).__name__, err))
+            else:
+                if not self.cancelled:
+                    self.signals.result.emit(result)
+        self.signals.finished.emit()
 
 
 class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
@@ -29,6 +72,18 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
 
         # Current directory for file selection
         self.cwd = os.getcwd()
+        # Files being parsed in the background
+        self.sens_loading = set()
+        self.cov_loading = set()
+        # Experiment, isotope, reaction and region of every loaded profile
+        self.sens_columns = []
+
+        # Workers for parsing files and preparing plot data
+        self.pool = PyQt5.QtCore.QThreadPool.globalInstance()
+        self.workers = []
+        self.workers_done = 0
+        # Only one thread uses self.plots at a time
+        self.plots_lock = threading.Lock()
 
         # Main widget
         self.widget = PyQt5.QtWidgets.QWidget()
@@ -42,6 +97,9 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Setup the covariance widget's widgets
         self.init_cov()
 
+        # Setup the progress of the background work
+        self.init_status()
+
     def init_sens(self):
         # Sensitivity widget
         self.sens_widget = PyQt5.QtWidgets.QGroupBox()
@@ -342,80 +400,179 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         self.plot_corr_btn.clicked.connect(self.plot_cov)
         self.cov_layout.addWidget(self.plot_corr_btn, 12)
 
+    def init_status(self):
+        # Progress bar and cancel button for the workers in the status bar
+        self.status_label = PyQt5.QtWidgets.QLabel()
+        self.statusBar().addWidget(self.status_label, 1)
+        self.progress_bar = PyQt5.QtWidgets.QProgressBar()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.cancel_btn = PyQt5.QtWidgets.QPushButton('Cancel')
+        self.cancel_btn.clicked.connect(self.cancel_workers)
+        self.statusBar().addPermanentWidget(self.cancel_btn)
+        self.progress_bar.hide()
+        self.cancel_btn.hide()
+
+    def start_worker(self, description, on_result, function, *args):
+        # Run function(*args) in the thread pool and pass the result to on_result
+        worker = Worker(description, function, *args)
+        worker.signals.progress.connect(self.status_label.setText)
+        worker.signals.result.connect(lambda result: self.worker_result(worker, on_result, result))
+        worker.signals.error.connect(self.show_error)
+        worker.signals.finished.connect(lambda: self.worker_finished(worker))
+        self.workers.append(worker)
+        self.update_progress()
+        self.pool.start(worker)
+        return worker
+
+    def show_error(self, message):
+        # Tell the user about an error from a worker
+        PyQt5.QtWidgets.QMessageBox.warning(self, 'Error', message)
+
+    def worker_result(self, worker, on_result, result):
+        # The worker may have been cancelled after sending its result
+        if not worker.cancelled:
+            self.use_plots(on_result, result)
+
+    def worker_finished(self, worker):
+        # Forget the worker and update the progress
+        if worker in self.workers:
+            self.workers.remove(worker)
+            self.workers_done += 1
+        self.update_progress()
+
+    def update_progress(self):
+        # Show the progress while any worker is queued or running
+        if len(self.workers) == 0:
+            self.workers_done = 0
+            self.status_label.setText('')
+            self.progress_bar.hide()
+            self.cancel_btn.hide()
+            return
+        self.progress_bar.setMaximum(self.workers_done + len(self.workers))
+        self.progress_bar.setValue(self.workers_done)
+        self.progress_bar.show()
+        self.cancel_btn.show()
+
+    def cancel_workers(self):
+        # Drop the queued workers and ignore the results of the running ones
+        for worker in list(self.workers):
+            worker.cancelled = True
+            if self.pool.tryTake(worker):
+                self.workers.remove(worker)
+        self.sens_loading = set()
+        self.cov_loading = set()
+        self.update_progress()
+
+    def use_plots(self, function, *args):
+        # Run function in the main thread once no worker is using self.plots
+        if not self.plots_lock.acquire(blocking=False):
+            # Try again later instead of freezing the window
+            PyQt5.QtCore.QTimer.singleShot(50, lambda: self.use_plots(function, *args))
+            return
+        try:
+            function(*args)
+        finally:
+            self.plots_lock.release()
+
+    def locked(self, function, *args):
+        # Run function in a worker thread while holding self.plots
+        with self.plots_lock:
+            return function(*args)
+
     def parse_sens_file(self):
-        # Let the user pick the sdf file to read in
-        sens_filename = PyQt5.QtWidgets.QFileDialog.getOpenFileName(self, 'Open file', self.cwd)[0]
-        # Parse the selected sdf file into a DataFrame
-        if sens_filename != '' and sens_filename not in self.sens_filenames:
+        # Let the user pick the sdf files to read in
+        sens_filenames = PyQt5.QtWidgets.QFileDialog.getOpenFileNames(self, 'Open files', self.cwd)[0]
+        # Parse each new sdf file in the background
+        for sens_filename in sens_filenames:
+            if sens_filename in self.sens_filenames or sens_filename in self.sens_loading:
+                continue
             # Check for an sdf file
             if sens_filename[-4:] != '.sdf':
                 print("File must be a '.sdf' file.")
-                return
-            # Parse the sensitivity file
-            self.plots.sdf_to_df(sens_filename)
-            # Row to place the new file name
-            row = len(self.sens_filenames)
-
-            # Update the widget to show the filename
-            sens_file_name_widget = PyQt5.QtWidgets.QLabel(sens_filename)
-            self.sens_file_grid_layout.addWidget(sens_file_name_widget, row, 0)
-            self.sens_filename_widgets.append(sens_file_name_widget)
-            self.sens_filenames.append(sens_filename)
+                continue
+            self.sens_loading.add(sens_filename)
+            self.start_worker('Parsing {}'.format(sens_filename), partial(self.add_sens_file, sens_filename),
+                              cached_read_sdf, sens_filename, self.plots.cache)
+
+    def add_sens_file(self, sens_filename, sdf_data):
+        # Add a parsed sdf file to the plots and the drop downs
+        if sens_filename not in self.sens_loading:
+            return
+        self.sens_loading.remove(sens_filename)
+        self.plots.add_sdf(sdf_data)
+        self.sens_columns.extend((sdf_data['experiment'],) + key for key in sdf_data['keys'])
+        # Row to place the new file name
+        row = len(self.sens_filenames)
+
+        # Update the widget to show the filename
+        sens_file_name_widget = PyQt5.QtWidgets.QLabel(sens_filename)
+        self.sens_file_grid_layout.addWidget(sens_file_name_widget, row, 0)
+        self.sens_filename_widgets.append(sens_file_name_widget)
+        self.sens_filenames.append(sens_filename)
+
+        # Get the high and low bounds of every loaded experiment
+        exps = set(sdf_data['experiment'] for sdf_data in self.plots.sdf_blocks)
+        groups = [self.plots.get_groups(exp) for exp in exps]
+        elows = np.unique(np.concatenate([group.lower for group in groups]))
+        ehighs = np.unique(np.concatenate([group.upper for group in groups]))[::-1]
+        # Turn the sorted energy bounds into strings
+        elows = [str(e) for e in elows]
+        ehighs = [str(e) for e in ehighs]
 
-            # Get the high and low bounds
-            elows = []
-            ehighs = []
-            for bound in self.plots.df.index:
-                # Add the high and low bounds to their list
-                elows.append(float(bound.split(':')[1]))
-                ehighs.append(float(bound.split(':')[0]))
-            # Sort the energy bounds and turn them back into strings
-            elows = [str(e) for e in sorted(elows)]
-            ehighs = [str(e) for e in sorted(ehighs, reverse=True)]
-
-            # Clear the energy bound combo boxes
-            self.sens_elow_box.clear()
-            self.sens_ehigh_box.clear()
-
-            # Update the energy bound combo boxes
-            self.sens_elow_box.addItems(elows)
-            self.sens_ehigh_box.addItems(ehighs)
-
-            # Update reaction combo boxes
-            self.update_exp_box()
+        # Clear the energy bound combo boxes
+        self.sens_elow_box.clear()
+        self.sens_ehigh_box.clear()
+
+        # Update the energy bound combo boxes
+        self.sens_elow_box.addItems(elows)
+        self.sens_ehigh_box.addItems(ehighs)
+
+        # Update reaction combo boxes
+        self.update_exp_box()
     
     def parse_cov_file(self):
-        # Let the user pick the covariance file to read in
-        cov_filename = PyQt5.QtWidgets.QFileDialog.getOpenFileName(self, 'Open file', self.cwd)[0]
+        # Let the user pick the covariance files to read in
+        cov_filenames = PyQt5.QtWidgets.QFileDialog.getOpenFileNames(self, 'Open files', self.cwd)[0]
         
-        # Parse the selected covariance file into the dictionary
-        if cov_filename != '' and cov_filename not in self.cov_filenames:
+        # Parse each new covariance file in the background
+        for cov_filename in cov_filenames:
+            fname = cov_filename.split('/')[-1]
+            if fname in self.cov_filenames or fname in self.cov_loading:
+                continue
             # Check for the file not being a covariance file
             if cov_filename[0:6] != 'scale.' and 'groupcov' not in cov_filename:
                 print('File must be a scale covariance file.')
-                return
-            # Parse the covariance file
-            self.plots.parse_coverx(cov_filename)
-            # Row to place the new file name
-            row = len(self.cov_filenames)
-
-            # Update the widget to show the filename
-            cov_file_name_widget = PyQt5.QtWidgets.QLabel(cov_filename)
-            self.cov_file_grid_layout.addWidget(cov_file_name_widget, row, 0)
-            self.cov_filename_widgets.append(cov_file_name_widget)
-            self.cov_filenames.append(cov_filename.split('/')[-1])
-
-            # Create dictionaries for mat IDs
-            for mat1, _, mat2, _ in self.plots.cov_matrices[cov_filename.split('/')[-1]].keys():
-                # Create a dictionary for names and IDs to sort
-                self.mat_ids[self.plots.get_mat_name(mat1)] = mat1
-                self.mat_ids[self.plots.get_mat_name(mat2)] = mat2
-
-            # Update reaction combo boxes
-            self.update_filename_box()
+                continue
+            self.cov_loading.add(fname)
+            self.start_worker('Parsing {}'.format(cov_filename), partial(self.add_cov_file, cov_filename),
+                              cached_read_coverx, cov_filename, self.plots.cache)
+
+    def add_cov_file(self, cov_filename, cov_data):
+        # Add a parsed covariance file to the plots and the drop downs
+        fname = cov_filename.split('/')[-1]
+        if fname not in self.cov_loading:
+            return
+        self.cov_loading.remove(fname)
+        self.plots.add_coverx(cov_filename, cov_data)
+        # Row to place the new file name
+        row = len(self.cov_filenames)
+
+        # Update the widget to show the filename
+        cov_file_name_widget = PyQt5.QtWidgets.QLabel(cov_filename)
+        self.cov_file_grid_layout.addWidget(cov_file_name_widget, row, 0)
+        self.cov_filename_widgets.append(cov_file_name_widget)
+        self.cov_filenames.append(fname)
+
+        # Create a dictionary for names and IDs to sort
+        self.mat_ids.update(self.plots.cov_index[fname]['mat_ids'])
+
+        # Update reaction combo boxes
+        self.update_filename_box()
 
 
     def reset_sens_files(self):
+        # Ignore the files still being parsed
+        self.sens_loading = set()
         if len(self.sens_filenames) > 0:
             # Clear file name widgets
             for sens_filename_widget in self.sens_filename_widgets:
@@ -423,7 +580,8 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
             # Remove saved information
             self.sens_filename_widgets = []
             self.sens_filenames = []
-            self.plots.df = None
+            self.sens_columns = []
+            self.use_plots(setattr, self.plots, 'df', None)
             # Clear the combo boxes
             combos = [self.exp_box, self.iso_box, self.inter_box,
                       self.unit_reg_box, self.sens_ehigh_box, self.sens_elow_box]
@@ -433,6 +591,8 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
             self.plot_data_reset_clicked()
 
     def reset_cov_files(self):
+        # Ignore the files still being parsed
+        self.cov_loading = set()
         if len(self.cov_filenames) > 0:
             # Clear the file name widgets
             for cov_filename_widget in self.cov_filename_widgets:
@@ -440,7 +600,7 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
             # Remove saved information
             self.cov_filename_widgets = []
             self.cov_filenames = []
-            self.plots.cov_matrices = {}
+            self.use_plots(self.clear_cov_data)
             self.mat_ids = {}
             # Clear the combo boxes
             self.cov_file_box.clear()
@@ -454,11 +614,16 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
             self.cov_reac1_label_edit.clear()
             self.cov_reac2_label_edit.clear()
 
+    def clear_cov_data(self):
+        # Remove the covariance files from the plots
+        self.plots.cov_matrices = {}
+        self.plots.cov_index = {}
+
     def update_exp_box(self):
         # Update the available options in the experiment drop down
         self.exp_box.clear()
         exps = []
-        for column in self.plots.df.columns:
+        for column in self.sens_columns:
             exps.append(column[0])
         self.exp_box.addItems(sorted(set(exps)))
         # Update the combo box size for new text
@@ -470,7 +635,7 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the available options in the isotope drop down
         self.iso_box.clear()
         isos = []
-        for column in self.plots.df.columns:
+        for column in self.sens_columns:
             if self.exp_box.currentText() == column[0]:
                 isos.append(column[1])
         self.iso_box.addItems(sorted(set(isos)))
@@ -483,7 +648,7 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the available options in the interactions drop down 
         self.inter_box.clear()
         inters = []
-        for column in self.plots.df.columns:
+        for column in self.sens_columns:
             if self.exp_box.currentText() == column[0]:
                 if self.iso_box.currentText() == column[1]:
                     inters.append(column[2])
@@ -497,7 +662,7 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the available options in the unit and region number drop down
         self.unit_reg_box.clear()
         unit_regs = []
-        for column in self.plots.df.columns:
+        for column in self.sens_columns:
             if self.exp_box.currentText() == column[0]:
                 if self.iso_box.currentText() == column[1]:
                     if self.inter_box.currentText() == column[2]:
@@ -517,17 +682,10 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the available options for the first nuclide drop down
         filename = self.cov_file_box.currentText()
         self.cov_reac1_nuclide_box.clear()
-        # Save mat names and dictionary of IDs for sorting
-        mats = []
-        for mat1, _, mat2, _ in self.plots.cov_matrices[filename].keys():
-            # Convert the id to a name
-            name1 = self.plots.get_mat_name(mat1)
-            name2 = self.plots.get_mat_name(mat2)
-            # Add both names to a list
-            mats.append(name1)
-            mats.append(name2)
+        # Every material with a matrix in the file
+        mat_names = self.plots.cov_index[filename]['mat_names']
         # Add the nuclides sorted by their ID
-        self.cov_reac1_nuclide_box.addItems(sorted(set(mats), key=lambda i: self.mat_ids[i]%1000000))
+        self.cov_reac1_nuclide_box.addItems(sorted(mat_names.values(), key=lambda i: self.mat_ids[i]%1000000))
         # Update the combo box size for new text
         self.cov_reac1_nuclide_box.resize(self.cov_reac1_nuclide_box.sizeHint())
         # Update the reaction 1 interaction combo box
@@ -537,20 +695,11 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the available options for the first interaction drop down
         filename = self.cov_file_box.currentText()
         self.cov_reac1_interaction_box.clear()
-        # Save mt names
-        mts = []
-        # Get the current nuclide name in reaction 1
-        curr_reac1_nuclide = self.cov_reac1_nuclide_box.currentText()
-        for mat1, mt1, mat2, mt2 in self.plots.cov_matrices[filename].keys():
-            # Names of the nuclides to check with reaction 1
-            mat1name = self.plots.get_mat_name(mat1)
-            mat2name = self.plots.get_mat_name(mat2)
-            # If the first nuclide in the key is in the reaction 1 box
-            if mat1name == curr_reac1_nuclide:
-                mts.append(self.plots.get_mt_name(mt1))
-            # If the second nuclide in the key is in the reaction 2 box
-            if mat2name == curr_reac1_nuclide:
-                mts.append(self.plots.get_mt_name(mt2))
+        cov_index = self.plots.cov_index[filename]
+        # Get the current nuclide in reaction 1
+        mat1 = cov_index['mat_ids'].get(self.cov_reac1_nuclide_box.currentText())
+        # Names of the reactions of the nuclide
+        mts = [cov_index['mt_names'][mt] for mt in cov_index['reactions'].get(mat1, ())]
         # Add the interactions
         self.cov_reac1_interaction_box.addItems(sorted(set(mts)))
         # Update the combo box size for new text
@@ -564,23 +713,8 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the available options for the second nuclide drop down
         filename = self.cov_file_box.currentText()
         self.cov_reac2_nuclide_box.clear()
-        # Save mat names and dictionary of IDs for sorting
-        mats = []
-        # Get the current reaction 1 information
-        curr_reac1_nuclide = self.cov_reac1_nuclide_box.currentText()
-        curr_reac1_interaction = self.cov_reac1_interaction_box.currentText()
-        for mat1, mt1, mat2, mt2 in self.plots.cov_matrices[filename].keys():
-            # Convert the ids to a name
-            mat1name = self.plots.get_mat_name(mat1)
-            mt1name = self.plots.get_mt_name(mt1)
-            mat2name = self.plots.get_mat_name(mat2)
-            mt2name = self.plots.get_mt_name(mt2)
-            # Check if reaction 1 is the first mat, mt pair
-            if mat1name == curr_reac1_nuclide and mt1name == curr_reac1_interaction:
-                mats.append(mat2name)
-            # Check if reaction 1 is the second mat, mt pair
-            elif mat2name == curr_reac1_nuclide and mt2name == curr_reac1_interaction:
-                mats.append(mat1name)
+        # Names of the nuclides with a matrix for reaction 1
+        mats = [self.plots.cov_index[filename]['mat_names'][mat] for mat, _ in self.get_reac1_partners()]
         # Add the nuclides sorted by their ID
         self.cov_reac2_nuclide_box.addItems(sorted(set(mats), key=lambda i: self.mat_ids[i]%1000000))
         # Update the combo box size for new text
@@ -592,24 +726,11 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the available options for the second interaction drop down
         filename = self.cov_file_box.currentText()
         self.cov_reac2_interaction_box.clear()
-        # Save mt names
-        mts = []
-        # Get the current combo boxes information
-        curr_reac1_nuclide = self.cov_reac1_nuclide_box.currentText()
-        curr_reac1_interaction = self.cov_reac1_interaction_box.currentText()
-        curr_reac2_nuclide = self.cov_reac2_nuclide_box.currentText()
-        for mat1, mt1, mat2, mt2 in self.plots.cov_matrices[filename].keys():
-            # Names of the nuclides to check with reaction 1 and nuclide 2
-            mat1name = self.plots.get_mat_name(mat1)
-            mt1name = self.plots.get_mt_name(mt1)
-            mat2name = self.plots.get_mat_name(mat2)
-            mt2name = self.plots.get_mt_name(mt2)
-            # Check if reaction 1 is the first mat, mt pair and reaction 2 nuclide is in second
-            if mat1name == curr_reac1_nuclide and mt1name == curr_reac1_interaction and mat2name == curr_reac2_nuclide:
-                mts.append(mt2name)
-            # Check if reaction 1 is the second mat, mt pair and reaction 2 nuclide is in first
-            elif mat2name == curr_reac1_nuclide and mt2name == curr_reac1_interaction and mat1name == curr_reac2_nuclide:
-                mts.append(mt1name)
+        cov_index = self.plots.cov_index[filename]
+        # Get the current nuclide in reaction 2
+        mat2 = cov_index['mat_ids'].get(self.cov_reac2_nuclide_box.currentText())
+        # Reactions of nuclide 2 with a matrix for reaction 1
+        mts = [cov_index['mt_names'][mt] for mat, mt in self.get_reac1_partners() if mat == mat2]
         # Add the interactions
         self.cov_reac2_interaction_box.addItems(sorted(set(mts)))
         # Update the combo box size for new text
@@ -617,6 +738,13 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
         # Update the text in the line edit
         self.update_reac2_edit()
 
+    def get_reac1_partners(self):
+        # (mat, mt) of every reaction with a matrix for reaction 1
+        cov_index = self.plots.cov_index[self.cov_file_box.currentText()]
+        mat1 = cov_index['mat_ids'].get(self.cov_reac1_nuclide_box.currentText())
+        mt1 = cov_index['mt_ids'].get(self.cov_reac1_interaction_box.currentText())
+        return cov_index['partners'].get((mat1, mt1), ())
+
     def update_reac1_edit(self):
         # Update the reaction 1 label edit to 'mat1name mt1name'
         mat1name = self.cov_reac1_nuclide_box.currentText()
@@ -724,23 +852,32 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
             if len(self.sens_keys) > 1:
                 corr_flag = self.corr_check.isChecked()
                 r_pos = self.corr_text_pos_box.currentText()               
-            # Stops 'QCoreApplication::exec: The event loop is already running' warning
-            plt.ion()
-            # If sensitivity button was pressed
-            if self.sender() == self.plot_sens_btn:
-                self.plots.sensitivity_plot(self.sens_keys, elow=elow, ehigh=ehigh, plot_err_bar=error_bar_flag,
-                                            plot_fill_bet=fill_bet_flag, plot_corr=corr_flag,
-                                            legend_dict=legend_entries, r_pos=r_pos)
-            # If sensitivity per unit lethargy button was pressed
-            else:
-                self.plots.sensitivity_lethargy_plot(self.sens_keys, elow=elow, ehigh=ehigh, plot_err_bar=error_bar_flag,
-                                                    plot_fill_bet=fill_bet_flag, plot_corr=corr_flag,
-                                                    legend_dict=legend_entries, r_pos=r_pos)
+            keys = list(self.sens_keys)
+            plot_lethargy = self.sender() != self.plot_sens_btn
+
+            def draw(data):
+                # Stops 'QCoreApplication::exec: The event loop is already running' warning
+                plt.ion()
+                # If sensitivity button was pressed
+                if not plot_lethargy:
+                    self.plots.sensitivity_plot(keys, elow=elow, ehigh=ehigh, plot_err_bar=error_bar_flag,
+                                                plot_fill_bet=fill_bet_flag, plot_corr=corr_flag,
+                                                legend_dict=legend_entries, r_pos=r_pos, data=data)
+                # If sensitivity per unit lethargy button was pressed
+                else:
+                    self.plots.sensitivity_lethargy_plot(keys, elow=elow, ehigh=ehigh, plot_err_bar=error_bar_flag,
+                                                        plot_fill_bet=fill_bet_flag, plot_corr=corr_flag,
+                                                        legend_dict=legend_entries, r_pos=r_pos, data=data)
+            # Prepare the data in the background and plot it once it is ready
+            self.start_worker('Preparing sensitivity plot', draw, self.locked, self.plots.plot_data.sensitivity,
+                              keys, elow, ehigh, plot_lethargy, corr_flag)
 
     def plot_cov(self):
         # If there is anything to plot
         if len(self.cov_filenames) > 0:
-            mt_names = {v: k for k, v in scale_plots.mt_ids.items()}
+            # Get the filename
+            filename = self.cov_file_box.currentText()
+            mt_names = self.plots.cov_index[filename]['mt_ids']
             # Get the mat and mt pairs
             mat1 = self.mat_ids[self.cov_reac1_nuclide_box.currentText()]
             mt1 = mt_names[self.cov_reac1_interaction_box.currentText()]
@@ -748,8 +885,6 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
             mt2 = mt_names[self.cov_reac2_interaction_box.currentText()]
             mat_mt_1 = (mat1, mt1)
             mat_mt_2 = (mat2, mt2)
-            # Get the filename
-            filename = self.cov_file_box.currentText()
             # Get the desired type of matrix plot
             if self.sender() == self.plot_cov_btn:
                 covariance = True
@@ -770,11 +905,16 @@ class SCALE_PLOTS_GUI(PyQt5.QtWidgets.QMainWindow):
             # Get the labels for the reactions
             label1 = self.cov_reac1_label_edit.text()
             label2 = self.cov_reac2_label_edit.text()
-            # Stops 'QCoreApplication::exec: The event loop is already running' warning
-            plt.ion()
-            self.plots.heatmap_plot(mat_mt_1, mat_mt_2, filename, covariance=covariance, elow=elow,
-                                    ehigh=ehigh, cmap=cmap, tick_step=tick_step, mode=mode,
-                                    label1=label1, label2=label2)
+
+            def draw(data):
+                # Stops 'QCoreApplication::exec: The event loop is already running' warning
+                plt.ion()
+                self.plots.heatmap_plot(mat_mt_1, mat_mt_2, filename, covariance=covariance, elow=elow,
+                                        ehigh=ehigh, cmap=cmap, tick_step=tick_step, mode=mode,
+                                        label1=label1, label2=label2, data=data)
+            # Decode and window the matrix in the background and plot it once it is ready
+            self.start_worker('Preparing matrix plot', draw, self.locked, self.plots.plot_data.heatmap,
+                              mat_mt_1, mat_mt_2, filename, covariance, elow, ehigh)
 
     def sens_file_grid_delete(self, widget):
         # Deletes a widget from the sensitivity file grid